@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+
+"""
+Generate deterministic synthetic inputs for the benchmarks
+
+The same size and seed always produce the same files:
+- contigs.fna: FASTA contigs, with filter_ids.tsv listing half of them (filter_fasta_by_id GENERAL format)
+- reads.fq: FASTQ reads with Illumina 1.8 (Phred+33) qualities
+- transcripts.gff: MMETSP-style GFF, one CDS per transcript with the strand as -1/1 and col9 starting with ID, with
+  transcripts.product_name mapping each LOCUS_TAG to a product name
+- featurecounts.tsv: featureCounts table of prodigal genes, with genes_abund.tsv holding the same table without the
+  featureCounts comment line (as used by combine_abundance_table_and_annotation genes)
+- eggnog.tsv: eggNOG-mapper annotations of the genes, with ko_pathway_link.tsv linking their KOs to pathways
+- ko_list.tsv: KEGG list/ko dump of the KOs, with ko_ids.txt listing the KOs of the genes (kegg_lookup offline mode)
+- taxa_profile.tsv: QIIME2 taxa barplot profile of the samples, with its metadata in sample_metadata.tsv
+"""
+
+import argparse
+import os
+import random
+
+
+# Number of records (contigs, reads, transcripts, genes) per dataset size
+SIZES = {'small': 1000, 'medium': 10000, 'large': 100000}
+
+NUM_SAMPLES = 6
+READ_LEN = 150
+NUM_KOS = 2000
+NUM_PATHWAYS = 200
+NUM_PROFILE_SAMPLES = 24
+
+PRODUCTS = [
+    'hypothetical protein',
+    'ABC transporter ATP-binding protein',
+    'DNA-directed RNA polymerase subunit beta',
+    'elongation factor Tu',
+    'photosystem II protein D1',
+    'ribulose bisphosphate carboxylase large chain',
+    'fucoxanthin chlorophyll a/c binding protein',
+    'heat shock protein 70',
+]
+
+EGGNOG_COLUMNS = [
+    '#query',
+    'seed_ortholog',
+    'evalue',
+    'score',
+    'eggNOG_OGs',
+    'max_annot_lvl',
+    'COG_category',
+    'Description',
+    'Preferred_name',
+    'GOs',
+    'EC',
+    'KEGG_ko',
+    'KEGG_Pathway',
+    'KEGG_Module',
+    'KEGG_Reaction',
+    'KEGG_rclass',
+    'BRITE',
+    'KEGG_TC',
+    'CAZy',
+    'BiGG_Reaction',
+    'PFAMs',
+]
+
+
+def get_rng(seed, name):
+    """Get a random generator of its own for each file so that the files do not depend on each other"""
+    return random.Random('{}:{}'.format(seed, name))
+
+
+def random_seq(rng, length):
+    """Get a random nucleotide sequence"""
+    return ''.join(rng.choices('ACGT', k=length))
+
+
+def get_contig_lengths(num_records, seed):
+    """Get the lengths of the contigs (shared by the FASTA and GFF files)"""
+    rng = get_rng(seed, 'contig_lengths')
+
+    return [rng.randint(300, 3000) for _ in range(num_records)]
+
+
+def get_gene_names(num_records):
+    """Get the prodigal gene names (<contig>_<gene number>) of the genes, four per contig"""
+    return ['contig_{}_{}'.format(idx // 4 + 1, idx % 4 + 1) for idx in range(num_records)]
+
+
+def write_fasta(fasta_file, contig_lengths, seed, width=60):
+    """Write the contigs as a FASTA file wrapped to a fixed line width"""
+    rng = get_rng(seed, 'fasta')
+
+    with open(fasta_file, 'w') as fasta:
+        for contig_num, length in enumerate(contig_lengths, start=1):
+            seq = random_seq(rng, length)
+            fasta.write('>contig_{}\n'.format(contig_num))
+            fasta.writelines(seq[idx : idx + width] + '\n' for idx in range(0, length, width))
+
+    return fasta_file
+
+
+def write_filter_ids(ids_file, num_records, seed):
+    """Write the IDs of half of the contigs"""
+    rng = get_rng(seed, 'filter_ids')
+    contig_nums = sorted(rng.sample(range(1, num_records + 1), num_records // 2))
+
+    with open(ids_file, 'w') as ids:
+        ids.writelines('contig_{}\n'.format(contig_num) for contig_num in contig_nums)
+
+    return ids_file
+
+
+def write_fastq(fastq_file, num_records, seed):
+    """Write FASTQ reads whose quality drops towards the 3' end, as in Illumina libraries"""
+    rng = get_rng(seed, 'fastq')
+
+    with open(fastq_file, 'w') as fastq:
+        for read_num in range(1, num_records + 1):
+            quals = [max(2, min(41, int(rng.gauss(38 - 15 * pos / READ_LEN, 3)))) for pos in range(READ_LEN)]
+            fastq.write(
+                '@read_{} 1:N:0:1\n{}\n+\n{}\n'.format(
+                    read_num, random_seq(rng, READ_LEN), ''.join(chr(qual + 33) for qual in quals)
+                )
+            )
+
+    return fastq_file
+
+
+def write_gff(gff_file, product_name_file, contig_lengths, seed):
+    """Write an MMETSP-style GFF file (in shuffled order) and the product name of each of its LOCUS_TAGs"""
+    rng = get_rng(seed, 'gff')
+    gff_lines, product_lines = [], []
+
+    for contig_num, length in enumerate(contig_lengths, start=1):
+        num_codons = rng.randint(length // 6, length // 3 - 1)
+        start = rng.randint(1, length - num_codons * 3 + 1)
+        end = start + num_codons * 3 - 1
+        locus_tag = 'MMETSP{:07d}'.format(contig_num)
+        product = rng.choice(PRODUCTS)
+
+        gff_lines.append(
+            'contig_{}\tMMETSP\tCDS\t{}\t{}\t.\t{}\t0\tID={}.p1;locus_tag={};product={};\n'.format(
+                contig_num, start, end, rng.choice(['1', '-1']), locus_tag, locus_tag, product
+            )
+        )
+        product_lines.append('{}\t{}\n'.format(locus_tag, product))
+
+    # Unsorted, so that sorting has work to do
+    rng.shuffle(gff_lines)
+
+    with open(gff_file, 'w') as gff:
+        gff.writelines(gff_lines)
+
+    with open(product_name_file, 'w') as product_names:
+        product_names.writelines(product_lines)
+
+    return gff_file
+
+
+def write_featurecounts(featurecounts_file, gene_names, seed, with_comment=True):
+    """Write a featureCounts table of prodigal genes with skewed counts across samples"""
+    rng = get_rng(seed, 'featurecounts')
+    sample_cols = ['sample_{}.bam'.format(sample_num) for sample_num in range(1, NUM_SAMPLES + 1)]
+
+    with open(featurecounts_file, 'w') as featurecounts:
+        if with_comment:
+            command = ['featureCounts', '-a', 'genes.saf', '-F', 'SAF', '-o', os.path.basename(featurecounts_file)]
+            featurecounts.write(
+                '# Program:featureCounts v2.0.1; Command:{}\n'.format(
+                    ' '.join('"{}"'.format(arg) for arg in command + sample_cols)
+                )
+            )
+
+        featurecounts.write('\t'.join(['Geneid', 'Chr', 'Start', 'End', 'Strand', 'Length'] + sample_cols) + '\n')
+
+        for gene_name in gene_names:
+            contig, gene_num = gene_name.rsplit('_', 1)
+            length = rng.randint(300, 3000)
+            start = rng.randint(1, 5000)
+            mean_count = rng.lognormvariate(3, 1.5)
+            counts = [int(rng.expovariate(1 / mean_count)) for _ in sample_cols]
+
+            featurecounts.write(
+                '\t'.join(
+                    ['{}_{}'.format(contig.split('_')[1], gene_num), contig, str(start), str(start + length - 1)]
+                    + [rng.choice('+-'), str(length)]
+                    + [str(count) for count in counts]
+                )
+                + '\n'
+            )
+
+    return featurecounts_file
+
+
+def write_eggnog(eggnog_file, gene_names, seed):
+    """Write an eggNOG-mapper annotation table where 70% of the genes have one to three KOs"""
+    rng = get_rng(seed, 'eggnog')
+
+    with open(eggnog_file, 'w') as eggnog:
+        eggnog.write('## emapper-2.1.6\n## command: emapper.py -i genes.faa -o eggnog --cpu 8\n##\n')
+        eggnog.write('\t'.join(EGGNOG_COLUMNS) + '\n')
+
+        for gene_name in gene_names:
+            if rng.random() < 0.7:
+                kos = rng.sample(range(1, NUM_KOS + 1), rng.randint(1, 3))
+                kegg_ko = ','.join('ko:K{:05d}'.format(ko) for ko in kos)
+            else:
+                kegg_ko = '-'
+
+            row = [gene_name, '2880.D7FXY1', '{:.2e}'.format(rng.uniform(1e-80, 1e-5))]
+            row += ['{:.1f}'.format(rng.uniform(50, 900))]
+            row += ['COG0001@1|root', 'Eukaryota', 'S', '-', '-', '-', '-', kegg_ko] + ['-'] * 9
+            eggnog.write('\t'.join(row) + '\n')
+
+        eggnog.write('## {} queries scanned\n## Total time (seconds): 10.0\n'.format(len(gene_names)))
+
+    return eggnog_file
+
+
+def write_ko_pathway_link(link_file, seed):
+    """Write a KEGG link/pathway/ko table linking each KO to one or two pathways"""
+    rng = get_rng(seed, 'ko_pathway_link')
+
+    with open(link_file, 'w') as links:
+        for ko in range(1, NUM_KOS + 1):
+            for pathway in rng.sample(range(1, NUM_PATHWAYS + 1), rng.randint(1, 2)):
+                links.write('ko:K{:05d}\tpath:map{:05d}\n'.format(ko, pathway))
+
+    return link_file
+
+
+def write_kegg_ko_list(ko_list_file, ko_ids_file, eggnog_file, seed):
+    """Write a KEGG list/ko dump and the list of KOs found in the eggNOG annotations"""
+    rng = get_rng(seed, 'ko_list')
+
+    with open(ko_list_file, 'w') as ko_list:
+        for ko in range(1, NUM_KOS + 1):
+            gene = rng.choice(PRODUCTS).split()[0].lower()
+            ko_list.write('ko:K{:05d}\t{}{}; {}\n'.format(ko, gene, ko, rng.choice(PRODUCTS)))
+
+    with open(eggnog_file, 'r') as eggnog, open(ko_ids_file, 'w') as ko_ids:
+        for line in eggnog:
+            if line.startswith('#'):
+                continue
+
+            kegg_ko = line.split('\t')[11]
+            if kegg_ko != '-':
+                ko_ids.writelines(ko + '\n' for ko in kegg_ko.split(','))
+
+    return ko_list_file
+
+
+def write_taxa_profile(profile_file, metadata_file, num_features, seed):
+    """Write a QIIME2 taxa barplot profile (samples x taxa counts, then the metadata) and the sample metadata"""
+    rng = get_rng(seed, 'taxa_profile')
+    taxa = ['k__Bacteria;p__Phylum{};g__Genus{}'.format(num % 40, num) for num in range(1, num_features + 1)]
+
+    # A few abundant taxa and a long tail of rare ones
+    mean_counts = [rng.paretovariate(1.2) for _ in taxa]
+
+    with open(profile_file, 'w') as profile, open(metadata_file, 'w') as metadata:
+        profile.write('\t'.join(['index'] + taxa + ['site']) + '\n')
+        metadata.write('sample-id\tsite\n#q2:types\tcategorical\n')
+
+        for sample_num in range(1, NUM_PROFILE_SAMPLES + 1):
+            sample, site = 'sample_{}'.format(sample_num), 'site_{}'.format(sample_num % 4 + 1)
+            counts = [int(rng.expovariate(1 / mean_count) * 10) for mean_count in mean_counts]
+            profile.write('\t'.join([sample] + [str(count) for count in counts] + [site]) + '\n')
+            metadata.write('{}\t{}\n'.format(sample, site))
+
+    return profile_file
+
+
+def generate_dataset(out_dir, size='small', seed=0):
+    """Write all synthetic input files of a dataset size to a directory and return their paths"""
+    num_records = SIZES[size]
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {
+        name: os.path.join(out_dir, file_name)
+        for name, file_name in [
+            ('fasta', 'contigs.fna'),
+            ('filter_ids', 'filter_ids.tsv'),
+            ('fastq', 'reads.fq'),
+            ('gff', 'transcripts.gff'),
+            ('product_name', 'transcripts.product_name'),
+            ('featurecounts', 'featurecounts.tsv'),
+            ('genes_abund', 'genes_abund.tsv'),
+            ('eggnog', 'eggnog.tsv'),
+            ('ko_pathway_link', 'ko_pathway_link.tsv'),
+            ('ko_list', 'ko_list.tsv'),
+            ('ko_ids', 'ko_ids.txt'),
+            ('taxa_profile', 'taxa_profile.tsv'),
+            ('sample_metadata', 'sample_metadata.tsv'),
+        ]
+    }
+
+    contig_lengths = get_contig_lengths(num_records, seed)
+    gene_names = get_gene_names(num_records)
+
+    write_fasta(paths['fasta'], contig_lengths, seed)
+    write_filter_ids(paths['filter_ids'], num_records, seed)
+    write_fastq(paths['fastq'], num_records, seed)
+    write_gff(paths['gff'], paths['product_name'], contig_lengths, seed)
+    write_featurecounts(paths['featurecounts'], gene_names, seed)
+    write_featurecounts(paths['genes_abund'], gene_names, seed, with_comment=False)
+    write_eggnog(paths['eggnog'], gene_names, seed)
+    write_ko_pathway_link(paths['ko_pathway_link'], seed)
+    write_kegg_ko_list(paths['ko_list'], paths['ko_ids'], paths['eggnog'], seed)
+    write_taxa_profile(paths['taxa_profile'], paths['sample_metadata'], num_records // 20, seed)
+
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate deterministic synthetic benchmark inputs')
+    parser.add_argument('out_dir', help='Directory of the generated files (one subdirectory per size)')
+    parser.add_argument(
+        '--sizes', nargs='+', choices=list(SIZES), default=['small'], help='Dataset sizes to generate. Default: small'
+    )
+    parser.add_argument('--seed', type=int, default=0, help='Random seed. Default: 0')
+    args = parser.parse_args(argv)
+
+    for size in args.sizes:
+        generate_dataset(os.path.join(args.out_dir, size), size, args.seed)
+        print('Generated {} dataset ({} records) in {}'.format(size, SIZES[size], os.path.join(args.out_dir, size)))
+
+
+if __name__ == '__main__':
+    main()
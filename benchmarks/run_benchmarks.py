@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the runtime and peak memory of the utilities on synthetic data and compare them against stored baselines
+
+Each benchmark runs in a fresh Python process, so that the peak memory of one does not carry over to the next:
+- startup: printing the help of `bioinfo-utils <tool>`, i.e. the import and argument parsing cost of a run
+- function: the hot paths fasta_to_dict, tabulate_fastq_info, get_gff_loc_tags and convert_featurecounts_to_tpm
+- cli: each tool and subcommand run end to end with --profile, keeping the time of each of its stages
+
+The compared time is the call itself for function benchmarks and the sum of the --profile stages for cli
+benchmarks (with the lazily imported modules of the tool loaded beforehand), so the interpreter start and imports,
+measured by the startup benchmarks, do not add their noise.
+
+A benchmark slower than its baseline is run again, and only reported as a regression if the median of these runs is
+also too slow. Startup times are dominated by imports (e.g. about 0.8 s for pandas), so they get a larger allowed
+absolute increase (--min_startup_time_diff).
+
+inspect_fastq always opens its plots, so it is only covered through startup and tabulate_fastq_info. The baselines
+are machine-specific and not version-controlled: record them on each machine with --update_baseline.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from bioinfo_utils import TOOLS  # noqa: E402
+from generate_data import SIZES, generate_dataset  # noqa: E402
+from bioinfo_utils_profiling import maxrss_to_mb  # noqa: E402
+
+
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, 'baselines.json')
+
+KINDS = ['startup', 'function', 'cli']
+
+# Hot path: (module, setup code, timed call); {name} fields are filled in with the dataset paths
+FUNCTION_BENCHMARKS = {
+    'fasta_to_dict': ('filter_fasta_by_id', '', 'fasta_to_dict({fasta!r})'),
+    'tabulate_fastq_info': ('inspect_fastq', '', 'tabulate_fastq_info({fastq!r}, "illumina1.8", 10000)'),
+    'get_gff_loc_tags': ('gff_parser', 'gff_df = load_gff({gff!r})', 'get_gff_loc_tags(gff_df)'),
+    'convert_featurecounts_to_tpm': ('featurecounts_to_tpm', '', 'convert_featurecounts_to_tpm({featurecounts!r})'),
+}
+
+FUNCTION_TEMPLATE = '''
+import json
+import time
+from {module} import *
+{setup}
+start = time.perf_counter()
+{call}
+print(json.dumps(dict(wall_time_s=time.perf_counter() - start)))
+'''
+
+# Tool subcommand: (arguments before the --profile option, arguments after it); {out} is the output directory and
+# tools with subcommands take --profile before the subcommand. Later runs may use the outputs of earlier ones.
+CLI_BENCHMARKS = {
+    'filter_fasta': (
+        ['filter_fasta'],
+        ['--filt_file_in', '{filter_ids}', '--fasta_in', '{fasta}', '--filt_file_type', 'GENERAL']
+        + ['--fasta_out', '{out}/filtered.fna'],
+    ),
+    'gff_parser parse_col7': (['gff_parser'], ['parse_col7', '{gff}', '{out}/parse_col7']),
+    'gff_parser add_prod_name_to_id': (
+        ['gff_parser'],
+        ['add_prod_name_to_id', '{gff}', '{product_name}', '{out}/add_prod_name_to_id'],
+    ),
+    'gff_parser add_attribute': (
+        ['gff_parser'],
+        ['add_attribute', '{gff}', '{product_name}', 'note', '{out}/add_attribute'],
+    ),
+    'gff_parser extract_seqs': (['gff_parser'], ['extract_seqs', '{gff}', '{fasta}', '{out}/extract', '--translate']),
+    'gff_parser sort': (['gff_parser'], ['sort', '{gff}', '{out}/sort', '--max_memory', '1', '--tmp_dir', '{out}']),
+    'featurecounts_to_tpm': (
+        ['featurecounts_to_tpm'],
+        ['--fc_table_in', '{featurecounts}', '--tpm_table_out', '{out}/tpm.tsv'],
+    ),
+    'featurecounts_to_tpm chunked': (
+        ['featurecounts_to_tpm'],
+        ['--fc_table_in', '{featurecounts}', '--tpm_table_out', '{out}/tpm_chunked.tsv', '--chunksize', '1000'],
+    ),
+    'combine_abundance genes': (
+        ['combine_abundance'],
+        ['genes', '--abund_table', '{genes_abund}', '--annot_table', '{eggnog}', '--out', '{out}/merged.tsv']
+        + ['--annot_mode', 'eggnog'],
+    ),
+    'combine_abundance aggregate': (
+        ['combine_abundance'],
+        ['aggregate', '--merged_table', '{out}/merged.tsv', '--group_by', 'Annotation', '--out', '{out}/ko.tsv'],
+    ),
+    'combine_abundance pathways': (
+        ['combine_abundance'],
+        ['pathways', '--merged_table', '{out}/merged.tsv', '--ko_pathway_link', '{ko_pathway_link}']
+        + ['--out', '{out}/pathways.tsv'],
+    ),
+    'stacked_barplot': (
+        ['stacked_barplot'],
+        ['--profile', '{taxa_profile}', '--format', 'QIIME2', '--metadata', '{sample_metadata}', '--top_n', '20']
+        + ['--headless', '--out', '{out}/barplot.html'],
+    ),
+    'kegg_lookup genes': (['kegg_lookup'], ['genes', '{ko_ids}', '{out}/ko_names.tsv', '--kegg_dump', '{ko_list}']),
+}
+
+# Modules imported lazily inside the first stage of a tool, imported before the tool starts so that their import time
+# (covered by the startup benchmarks) does not add its noise to the stage times
+PRELOAD_MODULES = {
+    'filter_fasta': ['pandas'],
+    'gff_parser parse_col7': ['pandas'],
+    'gff_parser add_prod_name_to_id': ['pandas'],
+    'gff_parser add_attribute': ['pandas'],
+    'combine_abundance aggregate': ['scipy.sparse'],
+    'combine_abundance pathways': ['scipy.sparse'],
+    'stacked_barplot': ['plotly.express', 'colorlover'],
+}
+
+CLI_TEMPLATE = '''
+import sys
+{imports}
+from bioinfo_utils import main
+sys.argv[0] = 'bioinfo_utils.py'
+sys.exit(main(sys.argv[1:]))
+'''
+
+# stacked_barplot already uses --profile for its input table
+PROFILE_FLAGS = {'stacked_barplot': '--profile_report'}
+
+# Files created next to the inputs, removed before each run so that every run does the same work
+INPUT_SIDE_FILES = {'gff_parser extract_seqs': ['{fasta}.fai']}
+
+
+def run_process(argv, log_file):
+    """Run a command and get its exit code, wall time and peak RSS (MB)"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get('PYTHONPATH')])))
+
+    with open(log_file, 'w') as log:
+        start = time.perf_counter()
+        proc = subprocess.Popen(argv, cwd=REPO_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+        # wait4 gives the resource usage of this child only (not available on Windows)
+        if hasattr(os, 'wait4'):
+            _, status, rusage = os.wait4(proc.pid, 0)
+            proc.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            peak_rss_mb = maxrss_to_mb(rusage.ru_maxrss)
+        else:
+            proc.wait()
+            peak_rss_mb = None
+
+        wall_time_s = time.perf_counter() - start
+
+    return proc.returncode, wall_time_s, peak_rss_mb
+
+
+def get_benchmark_commands(paths, out_dir, kinds, name_filters=None):
+    """Get the command line of each selected benchmark"""
+    fields = dict(paths, out=out_dir)
+    commands = dict()
+
+    if 'startup' in kinds:
+        commands['startup bioinfo_utils'] = [sys.executable, os.path.join(REPO_DIR, 'bioinfo_utils.py'), '--help']
+
+        for tool in TOOLS:
+            commands['startup ' + tool] = [sys.executable, os.path.join(REPO_DIR, 'bioinfo_utils.py'), tool, '--help']
+
+    if 'function' in kinds:
+        for func_name, (module, setup, call) in FUNCTION_BENCHMARKS.items():
+            code = FUNCTION_TEMPLATE.format(module=module, setup=setup.format(**fields), call=call.format(**fields))
+            commands['function ' + func_name] = [sys.executable, '-c', code]
+
+    if 'cli' in kinds:
+        for name, (tool_args, cmd_args) in CLI_BENCHMARKS.items():
+            report = os.path.join(out_dir, name.replace(' ', '_') + '.profile.json')
+            imports = '\n'.join('import ' + module for module in PRELOAD_MODULES.get(name, []))
+            commands['cli ' + name] = (
+                [sys.executable, '-c', CLI_TEMPLATE.format(imports=imports)]
+                + tool_args
+                + [PROFILE_FLAGS.get(tool_args[0], '--profile'), report]
+                + [arg.format(**fields) for arg in cmd_args]
+            )
+
+    if name_filters:
+        commands = {name: argv for name, argv in commands.items() if any(text in name for text in name_filters)}
+
+    return commands
+
+
+def run_benchmark(name, argv, paths, out_dir, repeats):
+    """Run a benchmark several times, keeping the fastest and median times and the largest peak RSS"""
+    log_file = os.path.join(out_dir, name.replace(' ', '_') + '.log')
+    report = os.path.join(out_dir, name.split(' ', 1)[1].replace(' ', '_') + '.profile.json')
+    result = dict(time_s=None, median_time_s=None, wall_time_s=None, peak_rss_mb=None)
+    times = []
+
+    for _ in range(repeats):
+        for side_file in INPUT_SIDE_FILES.get(name.split(' ', 1)[1], []):
+            side_file = side_file.format(**paths)
+            if os.path.exists(side_file):
+                os.remove(side_file)
+
+        returncode, wall_time_s, peak_rss_mb = run_process(argv, log_file)
+
+        if returncode != 0:
+            with open(log_file, 'r') as log:
+                return dict(error='exit code {}: {}'.format(returncode, log.read().strip().splitlines()[-1:]))
+
+        # The compared time leaves out the interpreter start and imports (covered by the startup benchmarks),
+        # which would otherwise drown the work of the functions and tools in noise
+        stages = None
+
+        if name.startswith('function'):
+            with open(log_file, 'r') as log:
+                time_s = json.loads(log.read().strip().splitlines()[-1])['wall_time_s']
+        elif name.startswith('cli'):
+            with open(report, 'r') as report_file:
+                stages = {stage['name']: stage['wall_time_s'] for stage in json.load(report_file)['stages']}
+            time_s = sum(stages.values())
+        else:
+            time_s = wall_time_s
+
+        times.append(time_s)
+
+        if result['time_s'] is None or time_s < result['time_s']:
+            result['time_s'] = round(time_s, 4)
+
+            if stages is not None:
+                result['stages'] = stages
+
+        result['wall_time_s'] = round(min(wall_time_s, result['wall_time_s'] or wall_time_s), 4)
+
+        if peak_rss_mb is not None:
+            result['peak_rss_mb'] = round(max(peak_rss_mb, result['peak_rss_mb'] or 0), 1)
+
+    result['median_time_s'] = round(statistics.median(times), 4)
+
+    return result
+
+
+def compare_to_baseline(result, baseline, tolerance, memory_tolerance, min_time_diff, time_key='time_s'):
+    """Get the regressions of a benchmark result (its fastest or its median time) compared to its baseline"""
+    regressions = []
+
+    if baseline is None or 'error' in result or 'error' in baseline:
+        return regressions
+
+    time_diff = result[time_key] - baseline['time_s']
+    if time_diff > tolerance * baseline['time_s'] and time_diff > min_time_diff:
+        regressions.append('time')
+
+    if result['peak_rss_mb'] is not None and baseline.get('peak_rss_mb') is not None:
+        if result['peak_rss_mb'] > (1 + memory_tolerance) * baseline['peak_rss_mb']:
+            regressions.append('memory')
+
+    return regressions
+
+
+def format_ratio(value, baseline_value):
+    """Format a result relative to its baseline"""
+    if value is None or not baseline_value:
+        return '-'
+
+    return '{:.2f}x'.format(value / baseline_value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the utilities on synthetic data and compare the results against stored baselines'
+    )
+    parser.add_argument(
+        '--sizes', nargs='+', choices=list(SIZES), default=['medium'], help='Dataset sizes to run. Default: medium'
+    )
+    parser.add_argument(
+        '--kinds', nargs='+', choices=KINDS, default=KINDS, help='Kinds of benchmarks to run. Default: all'
+    )
+    parser.add_argument('--filter', nargs='+', default=None, help='Only run the benchmarks whose name contains a text')
+    parser.add_argument('--repeats', type=int, default=3, help='Number of runs of each benchmark. Default: 3')
+    parser.add_argument(
+        '--data_dir',
+        default=None,
+        help='Directory of the synthetic inputs, generated if missing. Default: a temporary directory',
+    )
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic inputs. Default: 0')
+    parser.add_argument(
+        '--baseline',
+        default=DEFAULT_BASELINE,
+        help='Path to the baselines JSON file. Default: benchmarks/baselines.json',
+    )
+    parser.add_argument(
+        '--update_baseline', action='store_true', help='Store the results as the new baselines instead of comparing'
+    )
+    parser.add_argument(
+        '--tolerance', type=float, default=0.5, help='Allowed relative time increase. Default: 0.5'
+    )
+    parser.add_argument(
+        '--memory_tolerance', type=float, default=0.25, help='Allowed relative peak RSS increase. Default: 0.25'
+    )
+    parser.add_argument(
+        '--min_time_diff',
+        type=float,
+        default=0.2,
+        help='Time increases below this many seconds are treated as noise. Default: 0.2',
+    )
+    parser.add_argument(
+        '--min_startup_time_diff',
+        type=float,
+        default=0.5,
+        help='Time increases below this many seconds are treated as noise for the startup benchmarks. Default: 0.5',
+    )
+    parser.add_argument('--out', default=None, help='Path to output JSON file of the results')
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir if args.data_dir is not None else tempfile.mkdtemp(prefix='bioinfo_utils_bench_')
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as baseline_file:
+            baselines = json.load(baseline_file)
+    else:
+        baselines = dict(results=dict())
+
+        if not args.update_baseline:
+            print('No baselines in {}, record them with --update_baseline'.format(args.baseline))
+
+    results = dict()
+    num_regressions = 0
+
+    print('{:<44}{:>10}{:>10}{:>12}{:>10}  {}'.format('benchmark', 'time_s', 'vs_base', 'rss_mb', 'vs_base', 'status'))
+
+    for size in args.sizes:
+        size_dir = os.path.join(data_dir, size)
+        paths = generate_dataset(size_dir, size, args.seed)
+        out_dir = tempfile.mkdtemp(prefix='out_', dir=size_dir)
+        results[size] = dict()
+
+        for name, command in get_benchmark_commands(paths, out_dir, args.kinds, args.filter).items():
+            result = run_benchmark(name, command, paths, out_dir, args.repeats)
+            baseline = baselines['results'].get(size, dict()).get(name)
+            min_time_diff = args.min_startup_time_diff if name.startswith('startup') else args.min_time_diff
+            regressions = compare_to_baseline(result, baseline, args.tolerance, args.memory_tolerance, min_time_diff)
+
+            # Run a seemingly slower benchmark again (at least 3 times) to tell a regression from a noisy run
+            if 'time' in regressions:
+                result = run_benchmark(name, command, paths, out_dir, max(args.repeats, 3))
+                regressions = compare_to_baseline(
+                    result, baseline, args.tolerance, args.memory_tolerance, min_time_diff, time_key='median_time_s'
+                )
+
+            results[size][name] = result
+
+            if 'error' in result:
+                status = 'FAILED ' + result['error']
+                num_regressions += 1
+            else:
+                num_regressions += len(regressions) > 0
+                status = 'REGRESSION ({})'.format(', '.join(regressions)) if regressions else 'ok'
+
+                if baseline is None:
+                    status = 'new'
+
+            print(
+                '{:<44}{:>10}{:>10}{:>12}{:>10}  {}'.format(
+                    '{} {}'.format(size, name),
+                    '-' if result.get('time_s') is None else '{:.3f}'.format(result['time_s']),
+                    format_ratio(result.get('time_s'), (baseline or dict()).get('time_s')),
+                    '-' if result.get('peak_rss_mb') is None else '{:.1f}'.format(result['peak_rss_mb']),
+                    format_ratio(result.get('peak_rss_mb'), (baseline or dict()).get('peak_rss_mb')),
+                    status,
+                )
+            )
+
+        shutil.rmtree(out_dir)
+
+    if args.data_dir is None:
+        shutil.rmtree(data_dir)
+
+    machine = dict(python=platform.python_version(), platform=platform.platform(), processor=platform.machine())
+
+    if args.out is not None:
+        with open(args.out, 'w') as out_file:
+            json.dump(dict(machine=machine, results=results), out_file, indent=2)
+
+    if args.update_baseline:
+        # Only the benchmarks that were run are replaced
+        for size, size_results in results.items():
+            baselines['results'].setdefault(size, dict()).update(size_results)
+
+        baselines['machine'] = machine
+
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+
+        print('Updated the baselines in {}'.format(args.baseline))
+        return 0
+
+    if num_regressions:
+        print('{} benchmark(s) regressed or failed'.format(num_regressions))
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
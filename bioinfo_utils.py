@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+"""
+Single entry point to all utilities: bioinfo-utils <tool> [<subcommand>] [arguments]
+
+Only the module of the selected tool is imported, so running one tool does not pay for the dependencies of the others.
+"""
+
+import importlib
+import sys
+
+
+# Tool name: (module, function parsing the command line arguments, description)
+TOOLS = {
+    'gff_parser': ('gff_parser', 'main', 'Perform different processes to GFF files'),
+    'filter_fasta': ('filter_fasta_by_id', 'cli', 'Filter FASTA file based on a list of FASTA headers'),
+    'featurecounts_to_tpm': ('featurecounts_to_tpm', 'cli', 'Normalize featureCounts tables to TPM and other units'),
+    'combine_abundance': (
+        'combine_abundance_table_and_annotation',
+        'cli',
+        'Merge abundance tables with annotations and aggregate them per feature or pathway',
+    ),
+    'stacked_barplot': ('profile_to_stacked_barplot', 'cli', 'Produce stacked barplots from feature table profiles'),
+    'inspect_fastq': ('inspect_fastq', 'cli', 'Inspect FASTQ files interactively'),
+    'kegg_lookup': ('kegg_lookup', 'main', 'Retrieve KEGG gene and pathway names'),
+}
+
+
+def print_usage(file=sys.stdout):
+    """Print the list of available tools"""
+    print('usage: bioinfo-utils <tool> [<subcommand>] [arguments]\n\nTools:', file=file)
+
+    for tool, (_, _, description) in TOOLS.items():
+        print('  {:<22}{}'.format(tool, description), file=file)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    if not argv or argv[0] in ('-h', '--help'):
+        print_usage()
+        return 0
+
+    if argv[0] not in TOOLS:
+        print('bioinfo-utils: unknown tool "{}"\n'.format(argv[0]), file=sys.stderr)
+        print_usage(sys.stderr)
+        return 2
+
+    module_name, func_name, _ = TOOLS[argv[0]]
+
+    # Make argparse show "bioinfo-utils <tool>" in the usage messages
+    sys.argv[0] = 'bioinfo-utils {}'.format(argv[0])
+
+    module = importlib.import_module(module_name)
+    getattr(module, func_name)(argv[1:])
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
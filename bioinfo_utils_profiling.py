@@ -0,0 +1,140 @@
+"""
+Stage profiling shared by all utilities (enabled with --profile)
+
+Each call to `record_stage` closes a stage that started at the previous call (or at `start_profiling`), recording its
+wall time, the peak RSS so far of the process and of its largest finished child process (e.g. of the --threads
+workers) and, if given, the number of records processed per second. The report is printed to stderr and written as
+JSON by `finish_profiling`.
+"""
+
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+_report = None
+_last_time = None
+
+
+def add_profile_argument(parser, flag='--profile', dest='profile'):
+    """Add the shared --profile option to an argument parser (under another flag if --profile is already taken)"""
+    parser.add_argument(
+        flag,
+        dest=dest,
+        type=str,
+        required=False,
+        default=None,
+        metavar='PATH',
+        help='Report wall time, peak RSS and records/s per stage to stderr and as JSON to this path',
+    )
+
+    return parser
+
+
+def get_peak_rss_mb(children=False):
+    """Get the peak resident set size in MB of this process, or of its largest finished child process"""
+    if resource is None:
+        return None
+
+    # The peaks of the process and of its children happen at different times, so they are not added up
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+
+    return maxrss_to_mb(peak_rss)
+
+
+def maxrss_to_mb(ru_maxrss):
+    """Convert the ru_maxrss field of a resource usage to MB"""
+    # ru_maxrss is in bytes on macOS and in kB elsewhere
+    if sys.platform == 'darwin':
+        return ru_maxrss / 1024 / 1024
+
+    return ru_maxrss / 1024
+
+
+def start_profiling(tool, report_path, subcommand=None):
+    """Start profiling a run of a utility if a report path is given"""
+    global _report, _last_time
+
+    if report_path is None:
+        return None
+
+    _report = dict(
+        tool=tool,
+        subcommand=subcommand,
+        argv=sys.argv[1:],
+        report_path=report_path,
+        start_time=time.time(),
+        stages=[],
+    )
+    _last_time = time.perf_counter()
+
+    return _report
+
+
+def record_stage(name, records=None):
+    """Close the current stage (e.g. load, parse, merge, filter, write)"""
+    global _last_time
+
+    if _report is None:
+        return None
+
+    now = time.perf_counter()
+    stage = dict(
+        name=name,
+        wall_time_s=round(now - _last_time, 6),
+        peak_rss_mb=get_peak_rss_mb(),
+        child_peak_rss_mb=get_peak_rss_mb(children=True),
+    )
+
+    if records is not None:
+        stage['records'] = int(records)
+        stage['records_per_s'] = round(records / stage['wall_time_s'], 2) if stage['wall_time_s'] > 0 else None
+
+    _report['stages'].append(stage)
+    _last_time = time.perf_counter()
+
+    return stage
+
+
+def finish_profiling():
+    """Print the profiling report to stderr and write it as JSON"""
+    global _report
+
+    if _report is None:
+        return None
+
+    report = _report
+    report_path = report.pop('report_path')
+    report['total_wall_time_s'] = round(sum(stage['wall_time_s'] for stage in report['stages']), 6)
+    report['peak_rss_mb'] = get_peak_rss_mb()
+    report['child_peak_rss_mb'] = get_peak_rss_mb(children=True)
+
+    print(
+        '{:<24}{:>12}{:>14}{:>20}{:>16}'.format(
+            'stage', 'wall_time_s', 'peak_rss_mb', 'child_peak_rss_mb', 'records_per_s'
+        ),
+        file=sys.stderr,
+    )
+    for stage in report['stages']:
+        print(
+            '{:<24}{:>12.3f}{:>14}{:>20}{:>16}'.format(
+                stage['name'],
+                stage['wall_time_s'],
+                '-' if stage['peak_rss_mb'] is None else '{:.1f}'.format(stage['peak_rss_mb']),
+                '-' if stage['child_peak_rss_mb'] is None else '{:.1f}'.format(stage['child_peak_rss_mb']),
+                '-' if stage.get('records_per_s') is None else '{:.1f}'.format(stage['records_per_s']),
+            ),
+            file=sys.stderr,
+        )
+
+    with open(report_path, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+
+    _report = None
+
+    return report
@@ -0,0 +1,146 @@
+"""
+Read and write tables as TSV, Parquet, Feather or HDF5, with the format chosen by the file extension
+"""
+
+import pandas as pd
+
+
+BINARY_FORMATS = {
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'feather',
+    '.h5': 'hdf5',
+    '.hdf5': 'hdf5',
+    '.hdf': 'hdf5',
+}
+
+
+def get_table_format(path):
+    """Get the table format from the file extension (TSV for any unknown extension)"""
+    for ext, table_format in BINARY_FORMATS.items():
+        if path.lower().endswith(ext):
+            return table_format
+
+    return 'tsv'
+
+
+# Values with these characters need quoting, which the pyarrow CSV writer cannot do for a single value
+SPECIAL_CHARS_REGEX = '["\t\n\r]'
+
+
+def has_special_chars(df):
+    """Check if any text value of a dataframe contains a quote, tab or newline"""
+    for _, col in df.select_dtypes(include=['object', 'string', 'category']).items():
+        values = col.cat.categories if isinstance(col.dtype, pd.CategoricalDtype) else col.dropna()
+
+        if pd.Series(values, dtype=object).astype(str).str.contains(SPECIAL_CHARS_REGEX).any():
+            return True
+
+    return False
+
+
+def write_tsv(df, path, float_precision=None, append=False):
+    """
+    Write a dataframe as TSV, using the pyarrow CSV writer when it is installed
+
+    pyarrow writes floats in their shortest form (e.g. 1e-7 instead of 1e-07 and 1 instead of 1.0 with pandas). Tables
+    with quotes, tabs or newlines in their values are written by pandas, which quotes these values.
+    """
+    if float_precision is not None:
+        df = df.round(float_precision)
+
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        pa = None
+
+    arrow_table = None
+
+    if pa is not None and not has_special_chars(df):
+        # Booleans keep the pandas spelling (True/False rather than true/false)
+        bool_cols = df.select_dtypes(include='bool').columns
+        if len(bool_cols):
+            df = df.astype(dict.fromkeys(bool_cols, str))
+
+        try:
+            arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # e.g. columns mixing text and numbers
+            arrow_table = None
+
+    if arrow_table is None:
+        df.to_csv(path, sep='\t', index=False, mode='a' if append else 'w', header=not append)
+        return None
+
+    # Header is written separately so the column names are not quoted
+    with open(path, 'ab' if append else 'wb') as tsv:
+        if not append:
+            tsv.write(('\t'.join(str(col) for col in df.columns) + '\n').encode())
+
+        write_options = pa_csv.WriteOptions(include_header=False, delimiter='\t', quoting_style='none')
+        pa_csv.write_csv(arrow_table, tsv, write_options=write_options)
+
+    return None
+
+
+def check_chunked_output(path):
+    """Check that a table written in chunks is saved as TSV, before any chunk is written"""
+    table_format = get_table_format(path)
+
+    if table_format != 'tsv':
+        raise Exception('Exiting - Tables written in chunks can only be saved as TSV, not {}'.format(table_format))
+
+    return None
+
+
+def write_table(df, path, float_precision=None, append=False):
+    """Write a dataframe (without its index) in the format given by the file extension"""
+    table_format = get_table_format(path)
+
+    if table_format == 'tsv':
+        return write_tsv(df, path, float_precision, append)
+
+    if append:
+        check_chunked_output(path)
+
+    # Binary formats need string column names and a default index
+    df = df.reset_index(drop=True)
+    df.columns = [str(col) for col in df.columns]
+
+    if table_format == 'parquet':
+        df.to_parquet(path, index=False)
+    elif table_format == 'feather':
+        df.to_feather(path)
+    elif table_format == 'hdf5':
+        # The fixed HDF5 format does not support categorical columns
+        category_cols = df.select_dtypes(include='category').columns
+        df = df.astype(dict.fromkeys(category_cols, object))
+        df.to_hdf(path, key='table', mode='w', format='fixed')
+
+    return None
+
+
+def read_table(path, **kwargs):
+    """Read a table written by `write_table`"""
+    table_format = get_table_format(path)
+
+    if table_format == 'parquet':
+        return pd.read_parquet(path, **kwargs)
+    elif table_format == 'feather':
+        return pd.read_feather(path, **kwargs)
+    elif table_format == 'hdf5':
+        return pd.read_hdf(path, key='table', **kwargs)
+
+    return pd.read_csv(path, sep='\t', **kwargs)
+
+
+def iter_table_chunks(path, chunksize):
+    """Yield a table in chunks of rows (binary formats are read whole, as a single chunk)"""
+    if get_table_format(path) != 'tsv':
+        yield read_table(path)
+        return
+
+    for chunk_df in pd.read_csv(path, sep='\t', chunksize=chunksize):
+        yield chunk_df
@@ -1,11 +1,16 @@
-#!/home/bdhingpit/miniconda3/bin/python3
+#!/usr/bin/env python3
 
 """
 CLI-based utility to create to add feature abundance information based on gene or contig abundance
 """
 
 import argparse
+import re
+import numpy as np
 import pandas as pd
+from kegg_lookup import clean_kegg_id
+from bioinfo_utils_profiling import add_profile_argument, finish_profiling, record_stage, start_profiling
+from bioinfo_utils_table_io import check_chunked_output, iter_table_chunks, write_table
 
 
 def merge_contigs_abund_and_annot_tables(args):
@@ -17,11 +22,50 @@ def merge_contigs_abund_and_annot_tables(args):
 
 def merge_genes_abund_and_contig_tables(args):
     """Function connected with argparse `genes` subcommand"""
-    merged_df = merge_gene_tables(args.abund_table, args.annot_table, args.annot_mode)
+    if args.chunksize:
+        return merge_gene_tables_chunked(
+            args.abund_table,
+            args.annot_table,
+            args.annot_mode,
+            args.out,
+            args.chunksize,
+            args.expand_kos,
+            args.float_precision,
+        )
+
+    merged_df = merge_gene_tables(args.abund_table, args.annot_table, args.annot_mode, args.expand_kos)
 
     return merged_df
 
 
+def aggregate_merged_table_by_feature(args):
+    """Function connected with argparse `aggregate` subcommand"""
+    feature_names, sample_names, feature_sample_mat = aggregate_abundance(
+        args.merged_table, args.group_by, args.sample_cols, args.chunksize
+    )
+    write_sparse_abundance(
+        feature_names, sample_names, feature_sample_mat, args.group_by, args.out, args.float_precision
+    )
+    record_stage('write', len(feature_names))
+
+    return None
+
+
+def rollup_ko_abundance_to_pathways(args):
+    """Function connected with argparse `pathways` subcommand"""
+    ko_names, sample_names, ko_sample_mat = aggregate_abundance(
+        args.merged_table, args.ko_col, args.sample_cols, args.chunksize
+    )
+    link_df = load_ko_pathway_links(args.ko_pathway_link)
+    pathway_names, pathway_sample_mat = sum_kos_per_pathway(ko_names, ko_sample_mat, link_df, args.normalize_by_size)
+    record_stage('rollup', len(link_df))
+
+    write_sparse_abundance(pathway_names, sample_names, pathway_sample_mat, "Pathway", args.out, args.float_precision)
+    record_stage('write', len(pathway_names))
+
+    return None
+
+
 def parse_featureCounts_prodigal_table(annot_df):
     """Create new columns for gene-related properties"""
     # Split Geneid column and append to Chr (contig name) the gene number
@@ -39,6 +83,7 @@ def merge_contig_tables(abund_table, annot_table, will_split_lineage):
     # Load
     abund_df = pd.read_csv(abund_table, sep="\t")
     annot_df = pd.read_csv(annot_table, sep="\t", header=None)
+    record_stage('load', len(abund_df))
 
     # Merge
     merged_df = abund_df.merge(annot_df.iloc[:, list(range(0, 4)) + [-1]], left_on='Contig', right_on=0)
@@ -50,46 +95,62 @@ def merge_contig_tables(abund_table, annot_table, will_split_lineage):
 
     # Rename headers of columns 2-5
     merged_df = merged_df.rename(columns={1: 'TaxonID', 2: 'TaxonLevel', 3: 'TaxonName', 8: 'TaxonLineage'})
+    record_stage('merge', len(merged_df))
 
     if will_split_lineage:
         merged_df = split_mmseqs_lineage(merged_df)
+        record_stage('parse_lineage', len(merged_df))
 
     return merged_df
 
 
+# Rank prefixes used by MMSeqs2 in the taxonomic lineage (column name: prefix)
+LINEAGE_RANKS = dict(
+    superkingdom='d',
+    kingdom='k',
+    phylum='p',
+    class_='c',
+    order='o',
+    family='f',
+    genus='g',
+    species='s',
+)
+
+LINEAGE_REGEX = re.compile(r'(?:^|;)([dkpcofgs])_([\w\s]+)')
+
+
+def parse_mmseqs_lineage(lineage):
+    """Split a single MMSeqs2 lineage string into its ranks"""
+    prefix_names = dict()
+
+    if isinstance(lineage, str):
+        for prefix, name in LINEAGE_REGEX.findall(lineage):
+            prefix_names.setdefault(prefix, name)
+
+    # Missing ranks take the name of the rank above them
+    rank_names = []
+    rank_name = np.nan
+
+    for prefix in LINEAGE_RANKS.values():
+        rank_name = prefix_names.get(prefix, rank_name)
+        rank_names.append(rank_name)
+
+    return rank_names
+
+
 def split_mmseqs_lineage(merged_df):
     """Create new columns with separated taxonomic lineage"""
-    # Define the regex expressions
-    superkingdom = r'd_(?P<superkingdom>[\w\s]+)'
-    kingdom = r'\bk_(?P<kingdom>[\w\s]+)'
-    phylum = r'\bp_(?P<phylum>[\w\s]+)'
-    class_ = r'\bc_(?P<class>[\w\s]+)'
-    order = r'\bo_(?P<order>[\w\s]+)'
-    family = r'\bf_(?P<family>[\w\s]+)'
-    genus = r'\bg_(?P<genus>[\w\s]+)'
-    species = r'\bs_(?P<species>[\w\s]+)'
-
-    ranks_regex_dict = dict(
-        superkingdom=superkingdom,
-        kingdom=kingdom,
-        phylum=phylum,
-        class_=class_,
-        order=order,
-        family=family,
-        genus=genus,
-        species=species,
-    )
-
-    split_lineage_df = pd.DataFrame()
-    level = 0
-
-    for rank in ranks_regex_dict.keys():
-        rank_names = merged_df['TaxonLineage'].str.extract(ranks_regex_dict[rank])
-        split_lineage_df[rank] = rank_names
-
-        level += 1
-
-    split_lineage_df = split_lineage_df.T.ffill().T
+    # Parse each distinct lineage only once
+    lineage_codes, unique_lineages = pd.factorize(merged_df['TaxonLineage'], use_na_sentinel=False)
+    unique_rank_names = np.array([parse_mmseqs_lineage(lineage) for lineage in unique_lineages], dtype=object)
+    unique_rank_names = unique_rank_names.reshape(len(unique_lineages), len(LINEAGE_RANKS))
+
+    # Broadcast the parsed ranks back to all rows as categorical columns
+    split_lineage_df = pd.DataFrame(index=merged_df.index)
+
+    for level, rank in enumerate(LINEAGE_RANKS.keys()):
+        rank_cat = pd.Categorical(unique_rank_names[:, level])
+        split_lineage_df[rank] = pd.Categorical.from_codes(rank_cat.codes[lineage_codes], categories=rank_cat.categories)
 
     merged_split_df = pd.concat([split_lineage_df, merged_df], axis=1)
     merged_split_df = merged_split_df.drop(['TaxonID', 'TaxonLevel', 'TaxonName', 'TaxonLineage'], axis=1)
@@ -97,38 +158,92 @@ def split_mmseqs_lineage(merged_df):
     return merged_split_df
 
 
-def merge_gene_tables(abund_table, annot_table, annot_mode):
+def merge_gene_tables(abund_table, annot_table, annot_mode, expand_kos=False):
     """Merge gene abundance table and contigs"""
     # Load
     abund_df = pd.read_csv(abund_table, sep="\t")
 
-    if annot_mode == "eggnog":
-        annot_df = parse_eggnog_table(annot_table)
-    elif annot_mode == "kofamkoala":
-        annot_df = parse_kofamkoala_table(annot_table)
+    annot_df = load_gene_annot_table(annot_table, annot_mode, expand_kos)
+    record_stage('load', len(abund_df))
 
     # Clean abund_df from featureCounts
-    abund_df[["Geneid", "Gene_num"]] = abund_df["Geneid"].str.split("_", expand=True)
-    abund_df["Gene_name"] = abund_df["Chr"] + "_" + abund_df["Gene_num"].astype(str)
-    abund_df = abund_df.iloc[:, [-1] + list(range(6, abund_df.shape[1] - 2))]
+    abund_df = parse_featureCounts_prodigal_table(abund_df)
+    record_stage('parse', len(abund_df))
 
     # Merge then rearrange
     merged_df = abund_df.merge(annot_df, on="Gene_name")
     merged_df = merged_df.iloc[:, [-1, 0] + list(range(1, merged_df.shape[1] - 1))]
+    record_stage('merge', len(merged_df))
 
     return merged_df
 
 
-def parse_eggnog_table(annot_table):
+def merge_gene_tables_chunked(
+    abund_table, annot_table, annot_mode, out, chunksize, expand_kos=False, float_precision=None
+):
+    """Merge gene abundance table and annotation table by streaming the abundance table in chunks"""
+    check_chunked_output(out)
+
+    annot_df = load_gene_annot_table(annot_table, annot_mode, expand_kos)
+
+    # Index the annotations once by Gene_name so each chunk is joined through the same hash table
+    annot_df["Annotation"] = annot_df["Annotation"].astype("category")
+    annot_df = annot_df.set_index("Gene_name")
+    record_stage('load_annotation', len(annot_df))
+
+    is_first_chunk = True
+    num_genes = 0
+
+    for abund_df in pd.read_csv(abund_table, sep="\t", chunksize=chunksize):
+        num_genes += len(abund_df)
+        abund_df = parse_featureCounts_prodigal_table(abund_df)
+
+        # Join then rearrange
+        merged_df = abund_df.join(annot_df, on="Gene_name", how="inner")
+        merged_df = merged_df.iloc[:, [-1, 0] + list(range(1, merged_df.shape[1] - 1))]
+
+        write_table(merged_df, out, float_precision, append=not is_first_chunk)
+        is_first_chunk = False
+
+    record_stage('merge_and_write', num_genes)
+
+    return None
+
+
+def load_gene_annot_table(annot_table, annot_mode, expand_kos=False):
+    """Load the gene annotation table produced by the chosen annotation method"""
+    if annot_mode == "eggnog":
+        annot_df = parse_eggnog_table(annot_table, expand_kos)
+    elif annot_mode == "kofamkoala":
+        annot_df = parse_kofamkoala_table(annot_table, expand_kos)
+
+    return annot_df
+
+
+def parse_eggnog_table(annot_table, expand_kos=False):
     """Transform annotation table result from eggNOG"""
     # TODO: Add other options which gene groups (KO, COG, etc) to use
 
-    annot_df = pd.read_csv(annot_table, sep="\t", header=4)
+    # Locate the header line; the number of "##" comment lines before it differs between eggNOG versions
+    with open(annot_table, "r") as annot_file:
+        for header_idx, line in enumerate(annot_file):
+            if line.split("\t", 1)[0] == "#query":
+                break
+        else:
+            # eggNOG-mapper before v2.1 names the column "#query_name"
+            raise Exception('Exiting - No "#query" header line in {} (eggNOG-mapper v2.1+ expected)'.format(annot_table))
+
+    annot_df = pd.read_csv(annot_table, sep="\t", header=header_idx, usecols=["#query", "KEGG_ko"], dtype=str)
 
-    annot_df = annot_df[["#query", "KEGG_ko"]]
+    # Remove the "##" comment lines at the end of the table
+    annot_df = annot_df[~annot_df["#query"].str.startswith("##")]
 
-    # If multiple KOs are present, take the first one only
-    annot_df["KEGG_ko"] = annot_df["KEGG_ko"].str.split(",", expand=True)[0]
+    if expand_kos:
+        # If multiple KOs are present, keep each one as a separate row
+        annot_df = annot_df.assign(KEGG_ko=annot_df["KEGG_ko"].str.split(",")).explode("KEGG_ko")
+    else:
+        # If multiple KOs are present, take the first one only
+        annot_df["KEGG_ko"] = annot_df["KEGG_ko"].str.split(",", n=1).str[0]
 
     # Remove rows with missing KO annotations
     annot_df = annot_df[annot_df["KEGG_ko"].str.contains("-") == False].reset_index(drop=True)
@@ -139,19 +254,176 @@ def parse_eggnog_table(annot_table):
     return annot_df
 
 
-def parse_kofamkoala_table(annot_df):
-    # TODO: Finish function
-    pass
+def parse_kofamkoala_table(annot_table, expand_kos=False):
+    """Stream the KofamKOALA detail output and keep only the significant (*) hits"""
+    gene_names, kos = [], []
+    prev_gene_name = None
+
+    with open(annot_table, "r") as annot_file:
+        for line in annot_file:
+            # Significant hits are flagged with "*" in the first column
+            if not line.startswith("*"):
+                continue
+
+            gene_name, ko = line.split(None, 3)[1:3]
+
+            # Hits of a gene are sorted by score, so the first one is the best
+            if not expand_kos and gene_name == prev_gene_name:
+                continue
+
+            gene_names.append(gene_name)
+            kos.append(ko)
+            prev_gene_name = gene_name
+
+    annot_df = pd.DataFrame({"Gene_name": gene_names, "Annotation": kos})
+
+    return annot_df
+
+
+# Columns added to the abundance table by the `contigs` and `genes` subcommands, the other columns are samples
+MERGED_ANNOTATION_COLS = [
+    'Contig',
+    'Gene_name',
+    'Annotation',
+    'TaxonID',
+    'TaxonLevel',
+    'TaxonName',
+    'TaxonLineage',
+] + list(LINEAGE_RANKS)
+
+
+def aggregate_abundance(merged_table, group_by, sample_cols=None, chunksize=1000000):
+    """Sum the sample columns of a merged table per annotation (or rank) through a sparse indicator matrix"""
+    from scipy import sparse
+
+    feature_idx_dict = dict()
+    row_idx, col_idx, values = [], [], []
+    num_rows = 0
+
+    for merged_df in iter_table_chunks(merged_table, chunksize):
+        num_rows += len(merged_df)
+
+        # Unless given, samples are the numeric columns of the abundance table (e.g. not TaxonID)
+        if sample_cols is None:
+            sample_cols = [
+                col
+                for col in merged_df.select_dtypes("number").columns
+                if col != group_by and col not in MERGED_ANNOTATION_COLS
+            ]
+
+        # Drop genes without annotation, then map the annotations to global feature indices
+        merged_df = merged_df[merged_df[group_by].notna()]
+
+        if merged_df.empty:
+            continue
+
+        chunk_codes, chunk_features = pd.factorize(merged_df[group_by])
+        chunk_to_global = np.array([feature_idx_dict.setdefault(feature, len(feature_idx_dict)) for feature in chunk_features])
+
+        # Feature x gene indicator matrix multiplied by the sparse gene x sample abundance matrix
+        num_genes = len(chunk_codes)
+        indicator_mat = sparse.csr_matrix(
+            (np.ones(num_genes), (chunk_to_global[chunk_codes], np.arange(num_genes))),
+            shape=(len(feature_idx_dict), num_genes),
+        )
+        abund_mat = sparse.csr_matrix(merged_df[sample_cols].to_numpy(dtype=np.float64))
+        chunk_sum_mat = (indicator_mat @ abund_mat).tocoo()
+
+        row_idx.append(chunk_sum_mat.row)
+        col_idx.append(chunk_sum_mat.col)
+        values.append(chunk_sum_mat.data)
+
+    # Duplicate entries from different chunks are summed when converting to CSR
+    feature_sample_mat = sparse.coo_matrix(
+        (np.concatenate(values or [[]]), (np.concatenate(row_idx or [[]]), np.concatenate(col_idx or [[]]))),
+        shape=(len(feature_idx_dict), len(sample_cols)),
+    ).tocsr()
+    record_stage('aggregate', num_rows)
+
+    return list(feature_idx_dict.keys()), list(sample_cols), feature_sample_mat
+
+
+def write_sparse_abundance(feature_names, sample_names, feature_sample_mat, group_by, out, float_precision=None):
+    """Write the aggregated abundance as Matrix Market (.mtx), SciPy (.npz) or as a table depending on the extension"""
+    import scipy.io
+    from scipy import sparse
+
+    if out.endswith(".mtx") or out.endswith(".npz"):
+        if out.endswith(".mtx"):
+            scipy.io.mmwrite(out, feature_sample_mat)
+        else:
+            sparse.save_npz(out, feature_sample_mat)
+
+        # Row and column names are written next to the matrix
+        pd.Series(feature_names, name=group_by).to_csv(out + ".rows.tsv", sep="\t", index=False)
+        pd.Series(sample_names, name="Sample").to_csv(out + ".cols.tsv", sep="\t", index=False)
+    else:
+        feature_sample_df = pd.DataFrame(feature_sample_mat.toarray(), columns=sample_names)
+        feature_sample_df.insert(0, group_by, feature_names)
+        write_table(feature_sample_df, out, float_precision)
+
+    return None
+
+
+def load_ko_pathway_links(link_table):
+    """Load a KEGG KO-pathway link table (e.g. from https://rest.kegg.jp/link/pathway/ko)"""
+    link_df = pd.read_csv(link_table, sep="\t", header=None, usecols=[0, 1], names=["KO", "Pathway"], dtype=str)
+
+    # The link table can also be in pathway-KO order
+    if not clean_kegg_id(link_df.loc[0, "KO"]).startswith("K"):
+        link_df.columns = ["Pathway", "KO"]
+
+    # KEGG lists each pathway both as a map and a ko ID, so keep only the map IDs
+    link_df["KO"] = link_df["KO"].map(clean_kegg_id)
+    link_df["Pathway"] = link_df["Pathway"].map(clean_kegg_id).str.replace(r"^ko", "map", regex=True)
+
+    return link_df.drop_duplicates().reset_index(drop=True)
+
+
+def sum_kos_per_pathway(ko_names, ko_sample_mat, link_df, normalize_by_size=False):
+    """Sum the KO x sample abundance per pathway through a sparse pathway x KO membership matrix"""
+    from scipy import sparse
+
+    pathway_codes, pathway_names = pd.factorize(link_df["Pathway"])
+    ko_codes = pd.Index(ko_names).get_indexer(link_df["KO"])
+
+    # Only links to KOs present in the abundance table go into the membership matrix
+    is_detected = ko_codes >= 0
+    membership_mat = sparse.csr_matrix(
+        (np.ones(is_detected.sum()), (pathway_codes[is_detected], ko_codes[is_detected])),
+        shape=(len(pathway_names), len(ko_names)),
+    )
+    pathway_sample_mat = membership_mat @ ko_sample_mat
+
+    # Pathway size is the number of KOs in the pathway, detected or not
+    if normalize_by_size:
+        pathway_sizes = np.bincount(pathway_codes, minlength=len(pathway_names))
+        pathway_sample_mat = sparse.diags(1 / pathway_sizes) @ pathway_sample_mat
+
+    # Remove pathways without any detected KO
+    has_detected_kos = np.bincount(pathway_codes[is_detected], minlength=len(pathway_names)) > 0
+    pathway_sample_mat = sparse.csr_matrix(pathway_sample_mat)[has_detected_kos]
+
+    return list(pathway_names[has_detected_kos]), pathway_sample_mat
 
 
 def main(args):
+    start_profiling('combine_abundance_table_and_annotation', args.profile, args.feature_type)
+
     merged_df = args.func(args)
-    merged_df.to_csv(args.out, sep='\t', index=False)
+
+    # Chunked modes write their output as it is produced
+    if merged_df is not None:
+        write_table(merged_df, args.out, args.float_precision)
+        record_stage('write', len(merged_df))
+
+    finish_profiling()
 
     return None
 
 
-if __name__ == '__main__':
+def cli(argv=None):
+    """Parse the command line arguments and run the utility"""
     # Define parent parser
     parent_parser = argparse.ArgumentParser(
         formatter_class=argparse.RawTextHelpFormatter,
@@ -171,11 +443,31 @@ if __name__ == '__main__':
     )
 
     required_args.add_argument(
-        '--out', dest='out', type=str, required=True, metavar='PATH', help='Path to output merged table'
+        '--out',
+        dest='out',
+        type=str,
+        required=True,
+        metavar='PATH',
+        help='Path to output merged table. Saved as Parquet, Feather or HDF5 for *.parquet, *.feather or *.h5,\n'
+        'otherwise as TSV',
+    )
+
+    # Define optional arguments shared by the subcommands
+    optional_args = parent_parser.add_argument_group('Optional arguments')
+
+    optional_args.add_argument(
+        '--float_precision',
+        dest='float_precision',
+        type=int,
+        required=False,
+        metavar='INT',
+        default=None,
+        help='Round abundances to this many decimals when writing TSV output',
     )
 
     # Define main parser
     main_parser = argparse.ArgumentParser()
+    add_profile_argument(main_parser)
 
     # Define subcommands
     subparsers = main_parser.add_subparsers(title='Feature type', dest='feature_type', description='Available subcommands')
@@ -203,10 +495,158 @@ if __name__ == '__main__':
         choices=['eggnog', 'kofamkoala'],
         metavar='BOOL',
         default=True,
-        help='Gene annotation method used. Choices ["eggnog"]',
+        help='Gene annotation method used. Choices ["eggnog", "kofamkoala"]',
+    )
+    genes_subparser.add_argument(
+        '--expand_kos',
+        dest='expand_kos',
+        action='store_true',
+        help='Keep every KO of genes with multiple KOs as separate rows instead of only the first one',
+    )
+    genes_subparser.add_argument(
+        '--chunksize',
+        dest='chunksize',
+        type=int,
+        required=False,
+        metavar='INT',
+        default=None,
+        help='Stream the abundance table in chunks of this many genes and write each merged chunk as it is produced',
     )
     genes_subparser.set_defaults(func=merge_genes_abund_and_contig_tables)
 
-    args = main_parser.parse_args()
+    # Define aggregate_subparser arguments
+    aggregate_subparser = subparsers.add_parser("aggregate")
+    aggregate_subparser.add_argument(
+        '--merged_table',
+        dest='merged_table',
+        type=str,
+        required=True,
+        metavar='PATH',
+        help='Path to the merged table output of the `contigs` or `genes` subcommand',
+    )
+    aggregate_subparser.add_argument(
+        '--group_by',
+        dest='group_by',
+        type=str,
+        required=True,
+        metavar='TEXT',
+        help='Column to sum the abundance by (e.g. Annotation, genus)',
+    )
+    aggregate_subparser.add_argument(
+        '--out',
+        dest='out',
+        type=str,
+        required=True,
+        metavar='PATH',
+        help='Path to output aggregated table. Sparse formats are used for *.mtx and *.npz,\n'
+        'Parquet, Feather or HDF5 for *.parquet, *.feather or *.h5, otherwise TSV',
+    )
+    aggregate_subparser.add_argument(
+        '--sample_cols',
+        dest='sample_cols',
+        type=str,
+        nargs='+',
+        required=False,
+        metavar='TEXT',
+        default=None,
+        help='Sample columns to sum. Default: the numeric columns of the abundance table (not e.g. TaxonID)',
+    )
+    aggregate_subparser.add_argument(
+        '--chunksize',
+        dest='chunksize',
+        type=int,
+        required=False,
+        metavar='INT',
+        default=1000000,
+        help='Number of rows of the merged table read at a time. Default: 1000000',
+    )
+    aggregate_subparser.add_argument(
+        '--float_precision',
+        dest='float_precision',
+        type=int,
+        required=False,
+        metavar='INT',
+        default=None,
+        help='Round abundances to this many decimals when writing TSV output',
+    )
+    aggregate_subparser.set_defaults(func=aggregate_merged_table_by_feature)
+
+    # Define pathways_subparser arguments
+    pathways_subparser = subparsers.add_parser("pathways")
+    pathways_subparser.add_argument(
+        '--merged_table',
+        dest='merged_table',
+        type=str,
+        required=True,
+        metavar='PATH',
+        help='Path to the merged table output of the `genes` subcommand (or its KO output from `aggregate`)',
+    )
+    pathways_subparser.add_argument(
+        '--ko_pathway_link',
+        dest='ko_pathway_link',
+        type=str,
+        required=True,
+        metavar='PATH',
+        help='Path to the local KEGG KO-pathway link table (e.g. from https://rest.kegg.jp/link/pathway/ko)',
+    )
+    pathways_subparser.add_argument(
+        '--out',
+        dest='out',
+        type=str,
+        required=True,
+        metavar='PATH',
+        help='Path to output pathway abundance table. Sparse formats are used for *.mtx and *.npz,\n'
+        'Parquet, Feather or HDF5 for *.parquet, *.feather or *.h5, otherwise TSV',
+    )
+    pathways_subparser.add_argument(
+        '--ko_col',
+        dest='ko_col',
+        type=str,
+        required=False,
+        metavar='TEXT',
+        default='Annotation',
+        help='Column of the merged table containing the KOs. Default: Annotation',
+    )
+    pathways_subparser.add_argument(
+        '--normalize_by_size',
+        dest='normalize_by_size',
+        action='store_true',
+        help='Divide the pathway abundance by the number of KOs in the pathway',
+    )
+    pathways_subparser.add_argument(
+        '--sample_cols',
+        dest='sample_cols',
+        type=str,
+        nargs='+',
+        required=False,
+        metavar='TEXT',
+        default=None,
+        help='Sample columns to sum. Default: the numeric columns of the abundance table (not e.g. TaxonID)',
+    )
+    pathways_subparser.add_argument(
+        '--chunksize',
+        dest='chunksize',
+        type=int,
+        required=False,
+        metavar='INT',
+        default=1000000,
+        help='Number of rows of the merged table read at a time. Default: 1000000',
+    )
+    pathways_subparser.add_argument(
+        '--float_precision',
+        dest='float_precision',
+        type=int,
+        required=False,
+        metavar='INT',
+        default=None,
+        help='Round abundances to this many decimals when writing TSV output',
+    )
+    pathways_subparser.set_defaults(func=rollup_ko_abundance_to_pathways)
+
+    args = main_parser.parse_args(argv)
 
     main(args)
+
+
+if __name__ == '__main__':
+    cli()
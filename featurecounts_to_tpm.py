@@ -1,64 +1,434 @@
-#!/home/bdhingpit/miniconda3/bin/python3
+#!/usr/bin/env python3
 
 """
 CLI-based utility to normalize gene counts inferred by featureCounts to transcripts-per-million (TPM)
+or to other normalized abundances (RPKM/FPKM, CPM, TMM, DESeq-style median-of-ratios)
 """
 
 import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
+from bioinfo_utils_profiling import add_profile_argument, finish_profiling, record_stage, start_profiling
+from bioinfo_utils_table_io import check_chunked_output, write_table
 
 
-def convert_featurecounts_to_tpm(featurecounts_table):
-    """Normalize gene counts to TPM"""
+"""Normalization methods (each one modifies the float count matrix in place)"""
+
+
+def normalize_tpm(counts_mat, lengths, rpk_sums=None):
+    """Normalize counts to transcripts per million (TPM)"""
+    # Divide read counts by gene length in kbp = reads per kilobase (RPK)
+    counts_mat /= (lengths.astype(counts_mat.dtype) / 1000)[:, None]
+
+    # Divide RPK by sample/column sum of RPK and multiply by 1e6 to get TPM
+    if rpk_sums is None:
+        rpk_sums = counts_mat.sum(axis=0, dtype=np.float64)
+
+    counts_mat /= rpk_sums.astype(counts_mat.dtype)
+    counts_mat *= 1000000
+
+    return counts_mat
+
+
+def normalize_cpm(counts_mat, lengths, lib_sizes=None):
+    """Normalize counts to counts per million (CPM)"""
+    if lib_sizes is None:
+        lib_sizes = counts_mat.sum(axis=0, dtype=np.float64)
+
+    counts_mat /= lib_sizes.astype(counts_mat.dtype)
+    counts_mat *= 1000000
+
+    return counts_mat
+
+
+def normalize_rpkm(counts_mat, lengths, lib_sizes=None):
+    """Normalize counts to reads (or fragments) per kilobase per million (RPKM/FPKM)"""
+    counts_mat = normalize_cpm(counts_mat, lengths, lib_sizes)
+    counts_mat /= (lengths.astype(counts_mat.dtype) / 1000)[:, None]
+
+    return counts_mat
+
+
+def rank_average_ties(values):
+    """Rank values from 1, giving tied values the average of their ranks (as R's rank)"""
+    return pd.Series(values).rank(method='average').to_numpy()
+
+
+def calc_tmm_factors(counts_mat, logratio_trim=0.3, sum_trim=0.05):
+    """Compute the trimmed mean of M-values (TMM) normalization factors as in edgeR's calcNormFactors"""
+    lib_sizes = counts_mat.sum(axis=0, dtype=np.float64)
+
+    # Genes without counts in any sample carry no information
+    counts_mat = counts_mat[counts_mat.sum(axis=1) > 0]
+
+    # Reference sample is the one whose upper quartile is closest to the mean upper quartile
+    upper_quartiles = np.percentile(counts_mat / lib_sizes, 75, axis=0)
+
+    if np.median(upper_quartiles) < 1e-20:
+        ref_idx = np.argmax(np.sqrt(counts_mat).sum(axis=0))
+    else:
+        ref_idx = np.argmin(np.abs(upper_quartiles - upper_quartiles.mean()))
+
+    ref_counts, ref_lib_size = counts_mat[:, ref_idx], lib_sizes[ref_idx]
+
+    tmm_factors = np.ones(counts_mat.shape[1])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for sample_idx in range(counts_mat.shape[1]):
+            sample_counts, sample_lib_size = counts_mat[:, sample_idx], lib_sizes[sample_idx]
+
+            log_ratios = np.log2((sample_counts / sample_lib_size) / (ref_counts / ref_lib_size))
+            abs_exprs = (np.log2(sample_counts / sample_lib_size) + np.log2(ref_counts / ref_lib_size)) / 2
+            variances = (sample_lib_size - sample_counts) / sample_lib_size / sample_counts + (
+                ref_lib_size - ref_counts
+            ) / ref_lib_size / ref_counts
+
+            is_finite = np.isfinite(log_ratios) & np.isfinite(abs_exprs)
+            log_ratios, abs_exprs, variances = log_ratios[is_finite], abs_exprs[is_finite], variances[is_finite]
+
+            # Same distribution as the reference (e.g. the reference itself)
+            if len(log_ratios) == 0 or np.max(np.abs(log_ratios)) < 1e-6:
+                continue
+
+            # Trim genes by both log-ratio and absolute expression; count data has many ties, which share their rank
+            num_genes = len(log_ratios)
+            low_log_ratio, low_abs_expr = np.floor(num_genes * logratio_trim) + 1, np.floor(num_genes * sum_trim) + 1
+            log_ratio_ranks, abs_expr_ranks = rank_average_ties(log_ratios), rank_average_ties(abs_exprs)
+            is_kept = (
+                (log_ratio_ranks >= low_log_ratio)
+                & (log_ratio_ranks <= num_genes + 1 - low_log_ratio)
+                & (abs_expr_ranks >= low_abs_expr)
+                & (abs_expr_ranks <= num_genes + 1 - low_abs_expr)
+            )
+
+            # Precision-weighted mean of the kept log-ratios
+            weights = 1 / variances[is_kept]
+            log_factor = np.sum(log_ratios[is_kept] * weights) / np.sum(weights)
+            tmm_factors[sample_idx] = 1 if np.isnan(log_factor) else 2**log_factor
+
+    # Factors multiply to one
+    tmm_factors /= np.exp(np.mean(np.log(tmm_factors)))
+
+    return tmm_factors
+
+
+def normalize_tmm(counts_mat, lengths, lib_sizes=None):
+    """Normalize counts to TMM-scaled counts per million"""
+    lib_sizes = counts_mat.sum(axis=0, dtype=np.float64)
+    eff_lib_sizes = lib_sizes * calc_tmm_factors(counts_mat)
+
+    return normalize_cpm(counts_mat, lengths, eff_lib_sizes)
+
+
+def normalize_median_of_ratios(counts_mat, lengths, lib_sizes=None):
+    """Normalize counts by DESeq-style median-of-ratios size factors"""
+    with np.errstate(divide='ignore'):
+        log_counts = np.log(counts_mat, dtype=np.float64)
+
+    # Geometric mean per gene, using only genes expressed in all samples
+    log_geo_means = log_counts.mean(axis=1)
+    is_expressed = np.isfinite(log_geo_means)
+
+    if not is_expressed.any():
+        raise Exception('Exiting - No gene has non-zero counts in all samples, median-of-ratios cannot be computed')
+
+    size_factors = np.exp(np.median(log_counts[is_expressed] - log_geo_means[is_expressed, None], axis=0))
+    counts_mat /= size_factors.astype(counts_mat.dtype)
+
+    return counts_mat
+
+
+NORMALIZATION_METHODS = dict(
+    tpm=normalize_tpm,
+    rpkm=normalize_rpkm,
+    fpkm=normalize_rpkm,
+    cpm=normalize_cpm,
+    tmm=normalize_tmm,
+    median_of_ratios=normalize_median_of_ratios,
+)
+
+# Methods that only need per-sample sums, so they can be computed in chunks
+CHUNKABLE_METHODS = ['tpm', 'rpkm', 'fpkm', 'cpm']
+
+
+"""featureCounts table processing functions"""
+
+
+def get_output_path(out_table, method, num_methods):
+    """Add the method name before the extension when several methods are written"""
+    if num_methods == 1:
+        return out_table
+
+    out_root, out_ext = os.path.splitext(out_table)
+
+    return '{}.{}{}'.format(out_root, method, out_ext)
+
+
+def normalize_featurecounts(featurecounts_table, methods, dtype=np.float64):
+    """Normalize gene counts with one or more methods from a single load of the table"""
     featurecounts_df = pd.read_csv(featurecounts_table, sep="\t", header=1)
+    record_stage('load', len(featurecounts_df))
 
-    # Divide by 1000 so gene length is expressed as per kbp
-    featurecounts_df.Length = featurecounts_df.Length / 1000
+    # Methods normalize in place, so the matrix must not be a read-only view of a single-sample table
+    counts_mat = featurecounts_df.iloc[:, 6:].to_numpy(dtype=dtype, copy=True)
+    lengths = featurecounts_df.Length.to_numpy()
 
-    # Divide read counts by gene length = reads per kilobase (RPK)
-    featurecounts_df.iloc[:, 6:] = featurecounts_df.iloc[:, 6:].div(featurecounts_df.Length, axis=0)
+    normalized_dfs = dict()
 
-    # Divide RPK by sample/column sum of RPK
-    featurecounts_df.iloc[:, 6:] = featurecounts_df.iloc[:, 6:].div(featurecounts_df.iloc[:, 6:].sum(axis=0), axis=1)
+    for method_idx, method in enumerate(methods):
+        # The last method reuses the count matrix instead of copying it
+        method_mat = counts_mat if method_idx == len(methods) - 1 else counts_mat.copy()
+        method_mat = NORMALIZATION_METHODS[method](method_mat, lengths)
 
-    # Multiply by 1e6 to get TPM
-    featurecounts_df.iloc[:, 6:] = featurecounts_df.iloc[:, 6:] * 1000000
+        method_df = pd.DataFrame(method_mat, columns=featurecounts_df.columns[6:], index=featurecounts_df.index)
+        normalized_dfs[method] = pd.concat([featurecounts_df.iloc[:, :6], method_df], axis=1)
 
-    # Revert length to original value
-    featurecounts_df.Length = featurecounts_df.Length * 1000
+    record_stage('normalize', len(featurecounts_df))
 
-    return featurecounts_df
+    return normalized_dfs
 
 
-def main(featurecounts_table, tpm_table):
-    converted_fc_table = convert_featurecounts_to_tpm(featurecounts_table)
-    converted_fc_table.to_csv(tpm_table, sep="\t", index=False)
+def convert_featurecounts_to_tpm(featurecounts_table, dtype=np.float64):
+    """Normalize gene counts to TPM"""
+    return normalize_featurecounts(featurecounts_table, ['tpm'], dtype)['tpm']
 
 
-if __name__ == '__main__':
+def normalize_featurecounts_chunked(
+    featurecounts_table, out_table, chunksize, methods, dtype=np.float64, float_precision=None
+):
+    """Normalize gene counts in two passes over the table, holding one chunk in memory at a time"""
+    if not set(methods).issubset(CHUNKABLE_METHODS):
+        raise Exception('Exiting - Only {} can be computed in chunks'.format(', '.join(CHUNKABLE_METHODS)))
+
+    check_chunked_output(out_table)
+
+    # 1st pass: per-sample sums of counts and of RPK
+    lib_sizes, rpk_sums = 0, 0
+    num_genes = 0
+
+    for featurecounts_df in pd.read_csv(featurecounts_table, sep="\t", header=1, chunksize=chunksize):
+        num_genes += len(featurecounts_df)
+        counts_mat = featurecounts_df.iloc[:, 6:].to_numpy(dtype=dtype)
+        lib_sizes = lib_sizes + counts_mat.sum(axis=0, dtype=np.float64)
+        lengths_kbp = featurecounts_df.Length.to_numpy() / 1000
+        rpk_sums = rpk_sums + (counts_mat / lengths_kbp[:, None]).sum(axis=0, dtype=np.float64)
+
+    col_sums = dict(tpm=rpk_sums, rpkm=lib_sizes, fpkm=lib_sizes, cpm=lib_sizes)
+    record_stage('load_and_sum', num_genes)
+
+    # 2nd pass: write normalized rows chunk by chunk
+    is_first_chunk = True
+
+    for featurecounts_df in pd.read_csv(featurecounts_table, sep="\t", header=1, chunksize=chunksize):
+        counts_mat = featurecounts_df.iloc[:, 6:].to_numpy(dtype=dtype)
+        lengths = featurecounts_df.Length.to_numpy()
+
+        for method in methods:
+            method_mat = NORMALIZATION_METHODS[method](counts_mat.copy(), lengths, col_sums[method])
+            method_df = pd.DataFrame(method_mat, columns=featurecounts_df.columns[6:], index=featurecounts_df.index)
+
+            write_table(
+                pd.concat([featurecounts_df.iloc[:, :6], method_df], axis=1),
+                get_output_path(out_table, method, len(methods)),
+                float_precision,
+                append=not is_first_chunk,
+            )
+
+        is_first_chunk = False
+
+    record_stage('normalize_and_write', num_genes)
+
+    return None
+
+
+# Columns identifying a gene across featureCounts tables
+GENE_KEY_COLS = ['Geneid', 'Chr', 'Start', 'End']
+
+
+def check_featurecounts_genes(featurecounts_tables):
+    """Check that all featureCounts tables have the same genes and distinct samples before normalizing any of them"""
+    ref_genes = None
+    sample_tables = dict()
+
+    for featurecounts_table in featurecounts_tables:
+        # Sample columns follow the 6 gene annotation columns
+        for sample in pd.read_csv(featurecounts_table, sep="\t", header=1, nrows=0).columns[6:]:
+            if sample in sample_tables:
+                raise Exception(
+                    'Exiting - Sample {} is in both {} and {}'.format(sample, sample_tables[sample], featurecounts_table)
+                )
+
+            sample_tables[sample] = featurecounts_table
+
+        gene_keys_df = pd.read_csv(featurecounts_table, sep="\t", header=1, usecols=GENE_KEY_COLS, dtype=str)
+        genes = pd.MultiIndex.from_frame(gene_keys_df).sort_values()
+
+        if ref_genes is None:
+            ref_genes = genes
+        elif not genes.equals(ref_genes):
+            raise Exception(
+                'Exiting - Gene annotations of {} differ from those of {}'.format(featurecounts_table, featurecounts_tables[0])
+            )
+
+    return None
+
+
+def normalize_featurecounts_batch(featurecounts_tables, methods, dtype=np.float64, threads=1):
+    """Normalize many featureCounts tables in parallel and merge them into one gene x sample table per method"""
+    check_featurecounts_genes(featurecounts_tables)
+    record_stage('check_genes', len(featurecounts_tables))
+
+    with ProcessPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(normalize_featurecounts, table, methods, dtype) for table in featurecounts_tables]
+        batch_normalized_dfs = [future.result() for future in futures]
+
+    record_stage('normalize', len(featurecounts_tables))
+
+    merged_dfs = dict()
+
+    for method in methods:
+        method_dfs = [normalized_dfs[method].set_index(GENE_KEY_COLS) for normalized_dfs in batch_normalized_dfs]
+
+        # Align the sample columns of every table to the gene order of the first one
+        ref_df = method_dfs[0]
+        sample_dfs = [method_df.iloc[:, 2:].reindex(ref_df.index) for method_df in method_dfs]
+        merged_df = pd.concat([ref_df.iloc[:, :2]] + sample_dfs, axis=1)
+        merged_dfs[method] = merged_df.reset_index()
+
+    record_stage('merge', len(featurecounts_tables))
+
+    return merged_dfs
+
+
+def main(
+    featurecounts_table, tpm_table, chunksize=None, dtype=np.float64, methods=('tpm',), threads=1, float_precision=None
+):
+    if isinstance(featurecounts_table, list):
+        if len(featurecounts_table) > 1:
+            if chunksize:
+                raise Exception('Exiting - Chunked normalization works on a single featureCounts table only')
+
+            merged_dfs = normalize_featurecounts_batch(featurecounts_table, methods, dtype, threads)
+
+            for method, merged_df in merged_dfs.items():
+                write_table(merged_df, get_output_path(tpm_table, method, len(methods)), float_precision)
+
+            record_stage('write', len(merged_df))
+
+            return None
+
+        featurecounts_table = featurecounts_table[0]
+
+    if chunksize:
+        normalize_featurecounts_chunked(featurecounts_table, tpm_table, chunksize, methods, dtype, float_precision)
+        return None
+
+    normalized_dfs = normalize_featurecounts(featurecounts_table, methods, dtype)
+
+    for method, normalized_df in normalized_dfs.items():
+        write_table(normalized_df, get_output_path(tpm_table, method, len(methods)), float_precision)
+
+    record_stage('write', len(normalized_df))
+
+
+def cli(argv=None):
+    """Parse the command line arguments and run the utility"""
     # Parse command line arguments
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawTextHelpFormatter,
         usage=argparse.SUPPRESS,
-        description='Convert featureCounts abundance table to TPM',
+        description='Convert featureCounts abundance table to TPM (or other normalized abundances)',
     )
 
     parser.add_argument(
         '--fc_table_in',
         dest='featurecounts_table',
         type=str,
+        nargs='+',
         required=True,
         metavar='PATH',
-        help='Path to the featureCounts input table',
+        help='Path to the featureCounts input table. With several tables, they are normalized in parallel\n'
+        'and merged into one gene x sample table (all tables must have the same genes)',
     )
 
     parser.add_argument(
-        '--tpm_table_out', dest='tpm_table', type=str, required=True, metavar='PATH', help='Path to the TPM output table'
+        '--tpm_table_out',
+        dest='tpm_table',
+        type=str,
+        required=True,
+        metavar='PATH',
+        help='Path to the TPM output table. Saved as Parquet, Feather or HDF5 for *.parquet, *.feather or *.h5,\n'
+        'otherwise as TSV. With several methods, the method name is added before the extension',
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        '--method',
+        dest='methods',
+        type=str,
+        nargs='+',
+        required=False,
+        choices=list(NORMALIZATION_METHODS.keys()),
+        default=['tpm'],
+        metavar='TEXT',
+        help='Normalization method(s). Default: "tpm" || Choices: ["tpm", "rpkm", "fpkm", "cpm", "tmm", "median_of_ratios"]',
+    )
+
+    parser.add_argument(
+        '--chunksize',
+        dest='chunksize',
+        type=int,
+        required=False,
+        default=None,
+        metavar='INT',
+        help='Read the table twice in chunks of this many genes so memory does not grow with the number of genes.\n'
+        'Only for tpm, rpkm, fpkm and cpm',
+    )
+
+    parser.add_argument(
+        '--float32',
+        dest='float32',
+        action='store_true',
+        help='Compute and store normalized values as float32 to halve the memory of wide multi-sample tables',
+    )
+
+    parser.add_argument(
+        '--threads',
+        dest='threads',
+        type=int,
+        required=False,
+        default=1,
+        metavar='INT',
+        help='Number of processes used to normalize several featureCounts tables. Default: 1',
+    )
+
+    parser.add_argument(
+        '--float_precision',
+        dest='float_precision',
+        type=int,
+        required=False,
+        default=None,
+        metavar='INT',
+        help='Round normalized values to this many decimals when writing TSV output',
+    )
+
+    add_profile_argument(parser)
+
+    args = parser.parse_args(argv)
 
     featurecounts_table = args.featurecounts_table
     tpm_table = args.tpm_table
+    chunksize = args.chunksize
+    dtype = np.float32 if args.float32 else np.float64
+    methods = list(dict.fromkeys(args.methods))
+    threads = args.threads
+    float_precision = args.float_precision
 
-    main(featurecounts_table, tpm_table)
+    start_profiling('featurecounts_to_tpm', args.profile)
+    main(featurecounts_table, tpm_table, chunksize, dtype, methods, threads, float_precision)
+    finish_profiling()
+
+
+if __name__ == '__main__':
+    cli()
@@ -1,4 +1,4 @@
-#!/home/bdhingpit/miniconda3/bin/python3
+#!/usr/bin/env python3
 
 """
 CLI-based utility to filter a FASTA file based on a list of FASTA headers
@@ -6,11 +6,13 @@ CLI-based utility to filter a FASTA file based on a list of FASTA headers
 # TODO: Instead of indicating filt_file_type, just use a parameter that indicates the column number
 
 import argparse
-import pandas as pd
+from bioinfo_utils_profiling import add_profile_argument, finish_profiling, record_stage, start_profiling
 
 
 def get_contig_ids_from_dvf(filt_file, conf_thresh=0.9, pval_thresh=0.01):
     """Filter DeepVirFinder output based on confidence and p-values"""
+    import pandas as pd
+
     dvf_df = pd.read_csv(filt_file, sep='\t')
 
     filt_dvf_df = dvf_df.loc[(dvf_df['score'] >= conf_thresh) & (dvf_df['pvalue'] <= pval_thresh)].reset_index()
@@ -20,6 +22,8 @@ def get_contig_ids_from_dvf(filt_file, conf_thresh=0.9, pval_thresh=0.01):
 
 def get_contig_ids(filt_file):
     """Get the IDs listed in the MMSeqs2 output tsv file"""
+    import pandas as pd
+
     filt_file_df = pd.read_csv(filt_file, sep='\t', header=None)
 
     return list(filt_file_df[0])
@@ -94,17 +98,24 @@ def main(filt_file, fasta_file, filt_type, output_file):
         filt_contig_ids = get_contig_ids_from_dvf(filt_file)
     elif filt_type == "GENERAL":
         filt_contig_ids = get_contig_ids(filt_file)
+    record_stage('load', len(filt_contig_ids))
 
     fasta_dict = fasta_to_dict(fasta_file)
+    record_stage('parse', len(fasta_dict))
+
     filt_fasta_dict = filter_fasta(fasta_dict, filt_contig_ids)
+    record_stage('filter', len(fasta_dict))
+
     fasta_string = dict_to_fasta(filt_fasta_dict)
 
     output_fasta_file = open('{}'.format(output_file), 'w')
     output_fasta_file.write(fasta_string)
     output_fasta_file.close()
+    record_stage('write', len(filt_fasta_dict))
 
 
-if __name__ == '__main__':
+def cli(argv=None):
+    """Parse the command line arguments and run the utility"""
     # Parse command line arguments
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawTextHelpFormatter,
@@ -135,12 +146,19 @@ if __name__ == '__main__':
     parser.add_argument(
         '--fasta_out', dest='output_file', required=True, metavar='PATH', help='Path to output filtered FASTA file'
     )
+    add_profile_argument(parser)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     filt_file = args.filt_file
     fasta_file = args.fasta_file
     filt_type = args.filt_type
     output_file = args.output_file
 
+    start_profiling('filter_fasta_by_id', args.profile)
     main(filt_file, fasta_file, filt_type, output_file)
+    finish_profiling()
+
+
+if __name__ == '__main__':
+    cli()
@@ -1,14 +1,9 @@
 #!/bin/bash
 
 # Retrieve gene names associated with a list of 'KO' ids
+# (wrapper of `kegg_lookup.py genes`, which caches the KEGG list instead of downloading it on every run)
 
 kos_list=${1}
 kos_w_desc=${2}
 
-kegg_genes=$(curl -# https://rest.kegg.jp/list/ko)
-
-while read line
-do
-	hit=$(echo -e "${kegg_genes}" | grep "${line}")
-	echo -e "${hit}" | tee -a "${kos_w_desc}"
-done < ${kos_list}
+python3 "$(dirname "${0}")/kegg_lookup.py" genes "${kos_list}" "${kos_w_desc}"
@@ -1,15 +1,9 @@
 #!/bin/bash
 
 # Retrieve pathway names associated with 'ko' or 'map' ids
+# (wrapper of `kegg_lookup.py pathways`, which caches the KEGG list instead of downloading it on every run)
 
 kos_list=${1}
 kos_w_desc=${2}
 
-kegg_pathways=$(curl -# https://rest.kegg.jp/list/pathway)
-
-while read line
-do
-	hit=$(echo -e "${kegg_pathways}" | grep "${line/ko/map}")
-	echo -e "${line}\t${hit}"
-	echo -e "${line}\t${hit}" | cut -f1,3 >> ${kos_w_desc}
-done < ${kos_list}
+python3 "$(dirname "${0}")/kegg_lookup.py" pathways "${kos_list}" "${kos_w_desc}"
@@ -12,10 +12,21 @@ Definition of terms:
 
 
 import argparse
-import pandas as pd
+import heapq
+import itertools
+import os
+import tempfile
+from bioinfo_utils_profiling import add_profile_argument, finish_profiling, record_stage, start_profiling
 
-pd.set_option('display.max_colwidth', None)
-pd.set_option('display.max_columns', None)
+
+def import_pandas():
+    """Import pandas only in the subcommands that use it, to keep the streaming ones fast to start"""
+    import pandas as pd
+
+    pd.set_option('display.max_colwidth', None)
+    pd.set_option('display.max_columns', None)
+
+    return pd
 
 
 """General file processing functions"""
@@ -23,17 +34,21 @@ pd.set_option('display.max_columns', None)
 
 def load_gff(gff_file):
     """Load .gff file"""
+    pd = import_pandas()
+
     return pd.read_csv(gff_file, sep='\t', header=None)
 
 
 def load_prod_name(prod_names_file):
     """Load *.product_name file"""
+    pd = import_pandas()
+
     return pd.read_csv(prod_names_file, sep='\t', header=None)
 
 
 def check_dup_locus_tags(prod_names_loc_tag, gff_loc_tag):
     """Check *.product_namees and *.gff file if there are duplicate LOCUS TAGs"""
-    prod_names_loc_tag_dup = prod_names_loc_tag[prod_names_loc_tag.duplicated(cols=0)]
+    prod_names_loc_tag_dup = prod_names_loc_tag[prod_names_loc_tag.duplicated(subset=0)]
 
     return prod_names_loc_tag_dup
 
@@ -78,6 +93,226 @@ def is_id_field_set_first(gff_df):
         return False
 
 
+"""Sequence extraction functions"""
+
+
+COMPLEMENT_TABLE = str.maketrans('ACGTRYKMBVDHNacgtrykmbvdhn', 'TGCAYRMKVBHDNtgcayrmkvbhdn')
+
+CODON_TABLE = dict(
+    zip(
+        [a + b + c for a in 'TCAG' for b in 'TCAG' for c in 'TCAG'],
+        'FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+    )
+)
+
+
+def build_fasta_index(fasta_file):
+    """Create a samtools-compatible offset index (*.fai) of a FASTA file"""
+    fai_entries = dict()
+    seq_name = None
+
+    with open(fasta_file, 'rb') as fasta:
+        offset = 0
+
+        for line in fasta:
+            if line.startswith(b'>'):
+                seq_name = line[1:].split()[0].decode()
+                fai_entries[seq_name] = [0, offset + len(line), 0, 0]
+            elif seq_name is not None:
+                entry = fai_entries[seq_name]
+
+                # Line lengths are taken from the first sequence line of the entry
+                if entry[2] == 0:
+                    entry[2] = len(line.rstrip(b'\r\n'))
+                    entry[3] = len(line)
+
+                entry[0] += len(line.rstrip(b'\r\n'))
+
+            offset += len(line)
+
+    with open(fasta_file + '.fai', 'w') as fai:
+        for seq_name, (length, seq_offset, line_bases, line_width) in fai_entries.items():
+            fai.write('{}\t{}\t{}\t{}\t{}\n'.format(seq_name, length, seq_offset, line_bases, line_width))
+
+    return fai_entries
+
+
+def load_fasta_index(fasta_file):
+    """Load the *.fai index of a FASTA file, creating it first if it does not exist or is older than the FASTA file"""
+    fai_file = fasta_file + '.fai'
+
+    if not os.path.exists(fai_file) or os.path.getmtime(fasta_file) > os.path.getmtime(fai_file):
+        return build_fasta_index(fasta_file)
+
+    fai_entries = dict()
+
+    with open(fai_file, 'r') as fai:
+        for line in fai:
+            fields = line.rstrip('\n').split('\t')
+            fai_entries[fields[0]] = [int(field) for field in fields[1:5]]
+
+    return fai_entries
+
+
+def fetch_seq(fasta, fai_entry, start, end):
+    """Read the 1-based, end-inclusive region of a sequence from an open FASTA file"""
+    length, seq_offset, line_bases, line_width = fai_entry
+
+    if start < 1 or end > length or start > end:
+        raise Exception('Exiting - Coordinates {}-{} are out of range for a sequence of length {}'.format(start, end, length))
+
+    # Convert positions to byte offsets to account for the newlines at every line_bases
+    start_byte = seq_offset + ((start - 1) // line_bases) * line_width + (start - 1) % line_bases
+    end_byte = seq_offset + ((end - 1) // line_bases) * line_width + (end - 1) % line_bases
+
+    fasta.seek(start_byte)
+    region = fasta.read(end_byte - start_byte + 1).decode()
+
+    return region.replace('\n', '').replace('\r', '')
+
+
+def reverse_complement(seq):
+    """Reverse complement a nucleotide sequence"""
+    return seq.translate(COMPLEMENT_TABLE)[::-1]
+
+
+def translate_seq(seq, phase=0):
+    """Translate a CDS to protein using the standard genetic code"""
+    seq = seq[phase:].upper()
+
+    return ''.join(CODON_TABLE.get(seq[i : i + 3], 'X') for i in range(0, len(seq) - 2, 3))
+
+
+def is_minus_strand(strand):
+    """Check the strand of col7 (MMETSP GFFs store the strand as -1 and 1, see `parse_col7`)"""
+    return strand in ('-', '-1')
+
+
+def get_cds_group_key(fields, attr_dict, line_idx):
+    """Segments of a CDS split over several exons share their Parent (or, without a Parent, their ID)"""
+    group_id = attr_dict.get('Parent', attr_dict.get('ID'))
+
+    if group_id is None:
+        return (line_idx,)
+
+    return (fields[0], fields[2], group_id)
+
+
+def translate_cds_segments(fasta, fai_entry, segments):
+    """Join the segments of a CDS in transcription order and translate them from the phase of the first segment"""
+    if len(set(is_minus_strand(fields[6]) for fields in segments)) > 1:
+        raise Exception('Exiting - CDS segments at {}:{} are on both strands'.format(segments[0][0], segments[0][3]))
+
+    is_minus = is_minus_strand(segments[0][6])
+    segments = sorted(segments, key=lambda fields: int(fields[3]), reverse=is_minus)
+
+    seq_parts = []
+    for fields in segments:
+        seq = fetch_seq(fasta, fai_entry, int(fields[3]), int(fields[4]))
+        seq_parts.append(reverse_complement(seq) if is_minus else seq)
+
+    phase = int(segments[0][7]) if segments[0][7] in ('0', '1', '2') else 0
+
+    return translate_seq(''.join(seq_parts), phase)
+
+
+def parse_gff_attributes(col9):
+    """Represent the ATTRIBUTES in col9 of a GFF line as a dictionary"""
+    attr_dict = dict()
+
+    for attr in col9.strip().strip('"').split(';'):
+        if '=' in attr:
+            key, value = attr.split('=', 1)
+            attr_dict[key.strip()] = value.strip()
+
+    return attr_dict
+
+
+def iter_gff_lines(gff_file):
+    """Yield the split fields of each feature line of a GFF file"""
+    with open(gff_file, 'r') as gff:
+        for line in gff:
+            # Embedded sequences are placed after the features
+            if line.startswith('##FASTA'):
+                break
+
+            if line.startswith('#') or not line.strip():
+                continue
+
+            yield line.rstrip('\n').split('\t')
+
+
+def wrap_seq(seq, width=60):
+    """Split a sequence into lines of fixed width"""
+    return '\n'.join(seq[i : i + width] for i in range(0, len(seq), width))
+
+
+"""External sorting functions"""
+
+
+def gff_sort_key(line):
+    """Sort key of a GFF feature line (seqid, then start coordinate)"""
+    fields = line.split('\t', 4)
+
+    return fields[0], int(fields[3])
+
+
+def spill_sorted_chunk(chunk, tmp_dir, key=gff_sort_key):
+    """Sort a chunk of lines and write it to a temporary file"""
+    chunk.sort(key=key)
+
+    spill_file = tempfile.TemporaryFile(mode='w+', dir=tmp_dir, prefix='gff_sort_')
+    spill_file.writelines(chunk)
+    spill_file.seek(0)
+
+    return spill_file
+
+
+def id_record_key(record):
+    """Sort key of an ID record (the ID)"""
+    return record.split('\t', 1)[0]
+
+
+def get_id_records(attr_dict, seqid, feature_type):
+    """Get the ID record (ID, seqid and type) and Parent records of a feature, to be checked once sorted by ID"""
+    id_records = [parent + '\tParent\n' for parent in attr_dict.get('Parent', '').split(',') if parent]
+
+    if 'ID' in attr_dict:
+        id_records.append('{}\tID\t{}\t{}\n'.format(attr_dict['ID'], seqid, feature_type))
+
+    return id_records
+
+
+def check_id_records(sorted_id_records, max_examples=10):
+    """Count the duplicate IDs and the Parents without an ID in ID records sorted by ID, keeping a few examples"""
+    dup_ids, missing_parents = [], []
+    num_dup_ids, num_missing_parents = 0, 0
+
+    for feature_id, records in itertools.groupby(sorted_id_records, key=id_record_key):
+        # Features spanning several lines (e.g. CDS) share one ID on the same seqid and type
+        id_locations, is_parent = set(), False
+
+        for record in records:
+            fields = record.rstrip('\n').split('\t')
+
+            if fields[1] == 'ID':
+                id_locations.add((fields[2], fields[3]))
+            else:
+                is_parent = True
+
+        if len(id_locations) > 1:
+            num_dup_ids += 1
+            if len(dup_ids) < max_examples:
+                dup_ids.append(feature_id)
+
+        if is_parent and not id_locations:
+            num_missing_parents += 1
+            if len(missing_parents) < max_examples:
+                missing_parents.append(feature_id)
+
+    return num_dup_ids, dup_ids, num_missing_parents, missing_parents
+
+
 """Subcommand modes"""
 
 
@@ -85,16 +320,20 @@ def parse_col7(args):
     """Converts the -1, 1 in col7 to - and +, respectively"""
     # load gff file
     gff_df = load_gff(args.gff_file)
+    record_stage('load', len(gff_df))
 
     # in col7, if -1 replace by -, if +1, replace by +, if neither, replace by .
+    gff_df[6] = gff_df[6].astype(object)
     gff_df.loc[gff_df[6] == -1, 6] = '-'
     gff_df.loc[gff_df[6] == 1, 6] = '+'
     gff_df.loc[(gff_df[6] != '+') & (gff_df[6] != '-'), 6] = '.'
+    record_stage('parse', len(gff_df))
 
     print(gff_df)
 
     # Save file
     gff_df.to_csv(args.output_prefix + '_PARSE_COL7.gff', sep='\t', header=False, index=False)
+    record_stage('write', len(gff_df))
     return gff_df
 
 
@@ -103,9 +342,12 @@ def add_prod_name_to_id(args):
     Return the GFF file with the PRODUCT_NAME added to the ID field in GFF's 9th col
     (for now, this fxn uses the LOCUS_TAG to do the matching to PRODUCT_NAME)
     """
+    pd = import_pandas()
+
     # load needed files
     gff_df = load_gff(args.gff_file)
     prod_names_df = load_prod_name(args.product_name_file)
+    record_stage('load', len(gff_df))
 
     # Check first if ID fields are first ATTRIBUTES
     if not is_id_field_set_first(gff_df):
@@ -114,6 +356,7 @@ def add_prod_name_to_id(args):
     # Get locus tags
     loc_tags = get_gff_loc_tags(gff_df)
     gff_w_loc_tags = pd.concat([gff_df, loc_tags.to_frame(name='loc_tags')], axis=1)
+    record_stage('parse', len(gff_df))
 
     # merge GFF and product names file based on LOCUS_TAGs
     merged_df = gff_w_loc_tags.merge(prod_names_df, left_on='loc_tags', right_on=0).iloc[:, 0:12]
@@ -142,18 +385,23 @@ def add_prod_name_to_id(args):
 
     # Drop the cols past the ATTRIBUTE cols (col9)
     merged_df.drop(columns=[9, 10, 11], inplace=True)
+    record_stage('merge', len(merged_df))
 
     print(merged_df)
 
     # Save file
     merged_df.to_csv(args.output_prefix + '_ID_w_PROD_NAME.gff', sep='\t', header=False, index=False)
+    record_stage('write', len(merged_df))
     return gff_df
 
 
 def add_attribute(args):
     """Adds an attribute to col9 of GFF file"""
+    pd = import_pandas()
+
     gff_df = load_gff(args.gff_file)
     name_attr_map_df = pd.read_csv(args.locus_attr_map_file, sep='\t', header=None)
+    record_stage('load', len(gff_df))
 
     # Aggregate ATTR_VALUE based on same GENE_IDS
     new_name_attr_map_df = name_attr_map_df[[0, 1]].drop_duplicates().reset_index(drop=True)
@@ -163,6 +411,7 @@ def add_attribute(args):
     # Get LOCUS_TAGS
     loc_tags = get_gff_loc_tags(gff_df)
     gff_w_loc_tags = pd.concat([gff_df, loc_tags.to_frame(name='loc_tags')], axis=1)
+    record_stage('parse', len(gff_df))
 
     # merge GFF and ATTR map file file based on LOCUS_TAGs
     merged_df = gff_w_loc_tags.merge(new_name_attr_map_df, left_on='loc_tags', right_on=0, how='left').iloc[:, 0:12]
@@ -193,7 +442,7 @@ def add_attribute(args):
     # Merge column containing ATTR_CLASS and ATTR_VAL
     splt_df_bool = splt_df.apply(lambda x: x.astype(str).str.contains(args.attr_class))  # Find where the ATTR_CLASS are
 
-    attr_class_val_ser = pd.Series(0, index=idx_with_match)  # Instantiate a series
+    attr_class_val_ser = pd.Series('', index=idx_with_match)  # Instantiate a series
     exstng_attr_class = splt_df[splt_df_bool].apply(
         lambda x: ''.join(x.dropna().astype(str)), axis=1
     )  # Create a Series for the existing and newly-created attr_class
@@ -206,8 +455,8 @@ def add_attribute(args):
             attr_class_val_ser[i] = exstng_attr_class[i] + ',' + splt_df.loc[i, splt_df.columns[-1]]
 
     for i in splt_df.index.tolist():
-        splt_df.loc[i, :].replace(
-            to_replace=r'^{}.*'.format(args.attr_class), regex=True, value=attr_class_val_ser[i], inplace=True
+        splt_df.loc[i, :] = splt_df.loc[i, :].replace(
+            to_replace=r'^{}.*'.format(args.attr_class), regex=True, value=attr_class_val_ser[i]
         )  # ***DOUBLE CHECK THIS ONE, MIGHT HAVE A BUG WHEN ADDING MORE ATTR_VALS TO THE SAME ATTR_CLASS
 
     # Rejoin splt_df
@@ -215,16 +464,184 @@ def add_attribute(args):
 
     # Replace orig col9 in gff_df by modified col9
     gff_df.loc[col9_mod.index, 8] = col9_mod
+    record_stage('merge', len(gff_df))
 
     print(gff_df)
 
     # Export final gff file
     gff_df.to_csv(args.output_prefix + '_w_ADDED_ATTR.gff', sep='\t', header=False, index=False)
+    record_stage('write', len(gff_df))
+
+
+def extract_seqs(args):
+    """Extract the sequences of selected GFF features from the genome FASTA file"""
+    fai_entries = load_fasta_index(args.fasta_file)
+    record_stage('load_index', len(fai_entries))
+
+    # Collect the selection criteria
+    loc_tags_to_inc = None
+    if args.locus_tags_file:
+        with open(args.locus_tags_file, 'r') as loc_tags_file:
+            loc_tags_to_inc = set(line.strip() for line in loc_tags_file if line.strip())
+
+    attr_key, attr_value = None, None
+    if args.attribute:
+        attr_key, attr_value = args.attribute.split('=', 1)
+
+    out_ext = '.faa' if args.translate else '.fna'
+    num_extracted, num_features = 0, 0
+
+    # With --translate, the segments of each CDS are collected first and joined before translation
+    cds_groups = dict()
+
+    with open(args.fasta_file, 'rb') as fasta, open(args.output_prefix + '_EXTRACTED' + out_ext, 'w') as out_fasta:
+        for fields in iter_gff_lines(args.gff_file):
+            num_features += 1
+
+            if args.feature_type and fields[2] not in args.feature_type:
+                continue
+
+            attr_dict = parse_gff_attributes(fields[8])
+
+            if loc_tags_to_inc is not None and attr_dict.get('locus_tag') not in loc_tags_to_inc:
+                continue
+
+            if attr_key is not None and attr_value not in attr_dict.get(attr_key, '').split(','):
+                continue
+
+            if fields[0] not in fai_entries:
+                raise Exception('Exiting - Sequence {} is not in the FASTA file'.format(fields[0]))
+
+            seq_id = attr_dict.get('ID', attr_dict.get('locus_tag', '{}:{}-{}'.format(fields[0], fields[3], fields[4])))
+
+            if args.translate:
+                group_key = get_cds_group_key(fields, attr_dict, num_features)
+                cds_groups.setdefault(group_key, []).append((seq_id, fields))
+                continue
+
+            seq = fetch_seq(fasta, fai_entries[fields[0]], int(fields[3]), int(fields[4]))
+
+            if is_minus_strand(fields[6]):
+                seq = reverse_complement(seq)
+
+            out_fasta.write('>{}\n{}\n'.format(seq_id, wrap_seq(seq)))
+            num_extracted += 1
+
+        for group_key, group in cds_groups.items():
+            seq_ids = [seq_id for seq_id, _ in group]
+            segments = [fields for _, fields in group]
+
+            # Segments sharing an ID are written under it, otherwise under their Parent
+            seq_id = seq_ids[0] if len(set(seq_ids)) == 1 else group_key[-1]
+            seq = translate_cds_segments(fasta, fai_entries[segments[0][0]], segments)
+
+            out_fasta.write('>{}\n{}\n'.format(seq_id, wrap_seq(seq)))
+            num_extracted += 1
+
+    record_stage('filter_and_write', num_features)
+    print('Extracted {} features'.format(num_extracted))
+
+    return num_extracted
+
+
+def sort_gff(args):
+    """Sort a GFF file by seqid and start with bounded memory, validating its IDs and Parents"""
+    max_bytes = args.max_memory * 1024 * 1024
+    directives, spill_files, chunk = [], [], []
+    chunk_bytes, num_features = 0, 0
+    fasta_offset = None
 
+    # IDs and Parents are spilled alongside the features, sorted by ID, and checked once all are read
+    id_spill_files, id_chunk = [], []
 
-def main():
+    # Binary mode so that the offset of the FASTA section is exact whatever the line endings
+    with open(args.gff_file, 'rb') as gff:
+        for raw_line in iter(gff.readline, b''):
+            if raw_line.startswith(b'##FASTA'):
+                fasta_offset = gff.tell() - len(raw_line)
+                break
+
+            line = raw_line.decode().rstrip('\r\n') + '\n'
+
+            if line.startswith('###') or not line.strip():
+                continue
+
+            if line.startswith('#'):
+                directives.append(line)
+                continue
+
+            fields = line.split('\t')
+            id_records = get_id_records(parse_gff_attributes(fields[8]), fields[0], fields[2])
+            id_chunk.extend(id_records)
+
+            chunk.append(line)
+            num_features += 1
+
+            # Approximate per-line overhead of the str objects and list slots
+            chunk_bytes += len(line) + 100 + sum(len(id_record) + 100 for id_record in id_records)
+
+            if chunk_bytes >= max_bytes:
+                spill_files.append(spill_sorted_chunk(chunk, args.tmp_dir))
+                id_spill_files.append(spill_sorted_chunk(id_chunk, args.tmp_dir, key=id_record_key))
+                chunk, id_chunk, chunk_bytes = [], [], 0
+
+    # Merge the sorted spill files with the last in-memory chunks
+    chunk.sort(key=gff_sort_key)
+    id_chunk.sort(key=id_record_key)
+    record_stage('parse_and_spill', num_features)
+
+    num_dup_ids, dup_ids, num_missing_parents, missing_parents = check_id_records(
+        heapq.merge(*id_spill_files, id_chunk, key=id_record_key)
+    )
+
+    for spill_file in id_spill_files:
+        spill_file.close()
+
+    record_stage('check_ids', num_features)
+
+    print('Sorted using {} temporary file(s)'.format(len(spill_files)))
+    print('Duplicate IDs: {}'.format(num_dup_ids))
+    print('Parents without a matching ID: {}'.format(num_missing_parents))
+
+    # Fail before writing anything, so no complete-looking output is left behind
+    if args.strict and (num_dup_ids or num_missing_parents):
+        for spill_file in spill_files:
+            spill_file.close()
+
+        raise Exception(
+            'Exiting - Invalid GFF file. Duplicate IDs: {}. Missing Parents: {}'.format(
+                ','.join(dup_ids), ','.join(missing_parents)
+            )
+        )
+
+    # Write to a temporary file first so an interrupted run does not leave a truncated output
+    out_file = args.output_prefix + '_SORTED.gff'
+
+    with open(out_file + '.tmp', 'w') as out_gff:
+        out_gff.writelines(directives)
+        out_gff.writelines(heapq.merge(*spill_files, chunk, key=gff_sort_key))
+
+        # Append embedded sequences, if any, unchanged
+        if fasta_offset is not None:
+            with open(args.gff_file, 'rb') as gff:
+                gff.seek(fasta_offset)
+                for raw_line in gff:
+                    out_gff.write(raw_line.decode().rstrip('\r\n') + '\n')
+
+    os.replace(out_file + '.tmp', out_file)
+
+    for spill_file in spill_files:
+        spill_file.close()
+
+    record_stage('merge_and_write', num_features)
+
+    return dup_ids, missing_parents
+
+
+def main(argv=None):
     # Argument parser
     parser = argparse.ArgumentParser(prog='gff_parser.py', description='Perform different processes to GFF files')
+    add_profile_argument(parser)
 
     subparsers = parser.add_subparsers()
     subparsers.metavar = 'Sub-commands:'
@@ -257,8 +674,55 @@ def main():
     parser_fxn3.add_argument('output_prefix', help='Prefix of the output reformatted GFF file')
     parser_fxn3.set_defaults(func=add_attribute)
 
-    args = parser.parse_args()
+    # 4th subcommand
+    parser_fxn4 = subparsers.add_parser(
+        'extract_seqs', help='Extract the nucleotide or protein sequences of GFF features from the genome FASTA file'
+    )
+    parser_fxn4.add_argument('gff_file', help='Path to GFF file')
+    parser_fxn4.add_argument(
+        'fasta_file', help='Path to genome FASTA file (indexed to *.fai next to the FASTA file if not yet indexed)'
+    )
+    parser_fxn4.add_argument('output_prefix', help='Prefix of the output FASTA file')
+    parser_fxn4.add_argument(
+        '--feature_type', nargs='+', default=None, help='Feature types in col3 to extract (e.g. CDS gene). Default: all'
+    )
+    parser_fxn4.add_argument('--locus_tags_file', default=None, help='File listing the LOCUS_TAGs to extract, one per line')
+    parser_fxn4.add_argument(
+        '--attribute', default=None, help='Extract only features with this ATTRIBUTE in col9 (e.g. product=hypothetical)'
+    )
+    parser_fxn4.add_argument(
+        '--translate',
+        action='store_true',
+        help='Translate the extracted sequences to protein (for CDS features). '
+        'CDS segments sharing a Parent (or an ID) are joined in transcription order first',
+    )
+    parser_fxn4.set_defaults(func=extract_seqs)
+
+    # 5th subcommand
+    parser_fxn5 = subparsers.add_parser(
+        'sort', help='Sort the GFF file by seqid and start using bounded memory and validate IDs and Parents'
+    )
+    parser_fxn5.add_argument('gff_file', help='Path to GFF file')
+    parser_fxn5.add_argument('output_prefix', help='Prefix of the output sorted GFF file')
+    parser_fxn5.add_argument(
+        '--max_memory',
+        type=int,
+        default=512,
+        help='Approximate memory budget in MB for the features and their IDs before spilling to disk. Default: 512',
+    )
+    parser_fxn5.add_argument(
+        '--tmp_dir', default=None, help='Directory for the temporary spill files. Default: system temporary directory'
+    )
+    parser_fxn5.add_argument(
+        '--strict', action='store_true', help='Exit with an error if there are duplicate IDs or Parents without an ID'
+    )
+    parser_fxn5.set_defaults(func=sort_gff)
+
+    args = parser.parse_args(argv)
+
+    start_profiling('gff_parser', args.profile, args.func.__name__)
     args.func(args)
+    finish_profiling()
 
 
 if __name__ == '__main__':
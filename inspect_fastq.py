@@ -1,4 +1,4 @@
-#!/home/bdhingpit/miniconda3/envs/my_bioinfo_env/bin/python
+#!/usr/bin/env python3
 
 """
 For practice only.
@@ -6,15 +6,12 @@ For practice only.
 CLI-based utilty to show visualize quality profile of a FASTQ file (i.e. similar to FastQC).
 """
 
-import plotly.graph_objects as go
-import colorlover as cl
-import skbio
-from skbio.sequence import DNA
 import pandas as pd
 import numpy as np
 import argparse
 import time
 from warnings import simplefilter
+from bioinfo_utils_profiling import add_profile_argument, finish_profiling, record_stage, start_profiling
 
 
 def define_layout(plot_title, x_title, y_title, y_range, show_legend):
@@ -24,6 +21,8 @@ def define_layout(plot_title, x_title, y_title, y_range, show_legend):
     Module: per_base_qc_plot
     Module: fastq_stat
     """
+    import plotly.graph_objects as go
+
     layout = go.Layout(
         title=dict(text=plot_title, x=0.5),
         template="plotly_white",
@@ -45,7 +44,10 @@ def module_per_base_qc_plot(args):
     Module: per_base_qc_plot
     """
     fastq_df = tabulate_fastq_info(args.fastq, args.encoding, args.num_seqs)
+    record_stage('parse', fastq_df.shape[1])
+
     show_per_base_qc_plot(fastq_df, None)
+    record_stage('plot')
 
 
 def tabulate_fastq_info(fastq, encoding, num_seqs):
@@ -54,6 +56,8 @@ def tabulate_fastq_info(fastq, encoding, num_seqs):
 
     Module: per_base_qc_plot
     """
+    import skbio
+
     imported_fastq = list(skbio.io.read(fastq, format='fastq', verify=False, variant=encoding))
 
     fastq_df = pd.DataFrame()
@@ -75,6 +79,8 @@ def define_color_scale():
 
     Module: per_base_qc_plot
     """
+    import colorlover as cl
+
     col_scales = cl.scales['4']['div']['RdYlGn']
     col_scales_40 = cl.interp(col_scales, 40)
 
@@ -87,6 +93,8 @@ def create_boxes(fastq_df, col_scales):
 
     Module: per_base_qc_plot
     """
+    import plotly.graph_objects as go
+
     traces = []
 
     for base in range(len(fastq_df)):
@@ -117,6 +125,8 @@ def show_per_base_qc_plot(fastq_df, output):
 
     Module: per_base_qc_plot
     """
+    import plotly.graph_objects as go
+
     col_scales_40 = define_color_scale()
     traces = create_boxes(fastq_df, col_scales_40)
     layout = define_layout(
@@ -136,9 +146,13 @@ def module_fastq_stat(args):
     Module: fastq_stat
     """
     # TODO: `fastq_stat` module is unfinished
+    import skbio
+
     imported_fastq = list(skbio.io.read(args.fastq, format='fastq', verify=False, variant=args.encoding))
+    record_stage('parse', len(imported_fastq))
 
     show_fastq_stat_plots(imported_fastq)
+    record_stage('plot')
     # get_gc_content(imported_fastq)
 
 
@@ -148,6 +162,8 @@ def show_fastq_stat_plots(fastq):
 
     Module: fastq_stat
     """
+    import plotly.graph_objects as go
+
     hist_trace = create_seq_length_hist(fastq)
 
     fig = go.Figure(data=hist_trace)
@@ -161,6 +177,8 @@ def create_seq_length_hist(fastq):
     Module: fastq_stat
     """
     # TODO: Probably just merge this with `show_fastq_stat_plots`
+    import plotly.graph_objects as go
+
     fastq_seq_lengths = [len(seq) for seq in fastq]
 
     hist_trace = go.Histogram(x=fastq_seq_lengths)
@@ -175,6 +193,8 @@ def create_gc_content(fastq):
     Module: fastq_stat
     """
     # TODO: Unfinished
+    from skbio.sequence import DNA
+
     concat_seq = ""
 
     for seq in fastq:
@@ -199,10 +219,13 @@ def main(args):
     # Ignore pandas warnings
     simplefilter(action="ignore", category=pd.errors.PerformanceWarning)
 
+    start_profiling('inspect_fastq', args.profile, args.analysis_type)
     args.func(args)
+    finish_profiling()
 
 
-if __name__ == "__main__":
+def cli(argv=None):
+    """Parse the command line arguments and run the utility"""
     parent_parser = argparse.ArgumentParser(
         formatter_class=argparse.RawTextHelpFormatter, description="Inspect FASTQ files interactively", add_help=False
     )
@@ -225,6 +248,7 @@ if __name__ == "__main__":
 
     # Define main parser
     main_parser = argparse.ArgumentParser()
+    add_profile_argument(main_parser)
 
     subparser = main_parser.add_subparsers(title="Analysis type", dest="analysis_type", description="Available subcommands")
 
@@ -248,6 +272,10 @@ if __name__ == "__main__":
 
     fastq_stat_subparser.set_defaults(func=module_fastq_stat)
 
-    args = main_parser.parse_args()
+    args = main_parser.parse_args(argv)
 
     main(args)
+
+
+if __name__ == "__main__":
+    cli()
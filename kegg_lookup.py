@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+"""
+CLI-based utility to retrieve KEGG gene (KO) and pathway names for a list of IDs
+
+The KEGG `list/ko` and `list/pathway` dumps are downloaded once, cached on disk and re-downloaded only when
+older than the cache TTL. A local dump file can also be given to work offline.
+"""
+
+import argparse
+import http.client
+import os
+import sys
+import time
+import urllib.request
+from bioinfo_utils_profiling import add_profile_argument, finish_profiling, record_stage, start_profiling
+
+
+KEGG_REST_URL = 'https://rest.kegg.jp/list/{}'
+
+# Seconds without data from the KEGG server before giving up
+DOWNLOAD_TIMEOUT = 60
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'bioinfo_utils', 'kegg')
+
+# Prefixes that may precede the IDs (e.g. in eggNOG or KEGG link outputs)
+ID_PREFIXES = ('ko:', 'path:', 'map:')
+
+
+def download_kegg_list(list_name, cache_file):
+    """Download a KEGG list dump to the cache"""
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+
+    # Write to a temporary file first so an interrupted download does not leave a truncated cache
+    with urllib.request.urlopen(KEGG_REST_URL.format(list_name), timeout=DOWNLOAD_TIMEOUT) as response:
+        with open(cache_file + '.tmp', 'wb') as tmp_file:
+            tmp_file.write(response.read())
+
+    os.replace(cache_file + '.tmp', cache_file)
+
+    return cache_file
+
+
+def get_kegg_list_file(list_name, cache_dir=DEFAULT_CACHE_DIR, ttl_days=30):
+    """Get the path to the cached KEGG list dump, downloading it if missing or expired"""
+    cache_file = os.path.join(cache_dir, list_name + '.tsv')
+
+    if os.path.exists(cache_file) and time.time() - os.path.getmtime(cache_file) <= ttl_days * 86400:
+        return cache_file
+
+    try:
+        download_kegg_list(list_name, cache_file)
+    except (OSError, http.client.HTTPException):
+        # Without network access (or on a stalled or cut download), an expired cache is better than nothing
+        if not os.path.exists(cache_file):
+            raise
+
+        print('Could not update the cached KEGG {} list, using the existing one'.format(list_name), file=sys.stderr)
+
+    return cache_file
+
+
+def load_kegg_list(kegg_list_file):
+    """Load a KEGG list dump (ID<TAB>NAME per line) into a dictionary"""
+    kegg_dict = dict()
+
+    with open(kegg_list_file, 'r') as kegg_list:
+        for line in kegg_list:
+            kegg_id, _, name = line.rstrip('\n').partition('\t')
+            kegg_dict[clean_kegg_id(kegg_id)] = name
+
+    return kegg_dict
+
+
+def clean_kegg_id(kegg_id):
+    """Remove the database prefix of a KEGG ID"""
+    kegg_id = kegg_id.strip()
+
+    for prefix in ID_PREFIXES:
+        if kegg_id.startswith(prefix):
+            return kegg_id[len(prefix) :]
+
+    return kegg_id
+
+
+def lookup_kegg_names(kegg_ids, kegg_dict, is_pathway=False):
+    """Get the name of each KEGG ID (empty string if not found)"""
+    kegg_names = []
+
+    for kegg_id in kegg_ids:
+        lookup_id = clean_kegg_id(kegg_id)
+
+        # Pathways are listed as map IDs (e.g. ko00010 -> map00010)
+        if is_pathway and lookup_id.startswith('ko'):
+            lookup_id = 'map' + lookup_id[2:]
+
+        kegg_names.append(kegg_dict.get(lookup_id, ''))
+
+    return kegg_names
+
+
+def read_ids(ids_file):
+    """Read one KEGG ID per line"""
+    with open(ids_file, 'r') as ids:
+        return [line.strip() for line in ids if line.strip()]
+
+
+"""Subcommand modes"""
+
+
+def get_names(args, list_name, is_pathway):
+    """Write the KEGG name of each ID in the input list"""
+    if args.kegg_dump:
+        kegg_list_file = args.kegg_dump
+    else:
+        kegg_list_file = get_kegg_list_file(list_name, args.cache_dir, args.ttl_days)
+
+    kegg_dict = load_kegg_list(kegg_list_file)
+    kegg_ids = read_ids(args.ids_file)
+    record_stage('load', len(kegg_dict))
+
+    kegg_names = lookup_kegg_names(kegg_ids, kegg_dict, is_pathway)
+    record_stage('lookup', len(kegg_ids))
+
+    with open(args.out_file, 'w') as out_file:
+        for kegg_id, kegg_name in zip(kegg_ids, kegg_names):
+            out_file.write('{}\t{}\n'.format(kegg_id, kegg_name))
+
+    record_stage('write', len(kegg_ids))
+
+    print('Found names for {} of {} IDs'.format(sum(1 for name in kegg_names if name), len(kegg_ids)))
+
+    return kegg_names
+
+
+def get_gene_names(args):
+    """Retrieve gene names associated with a list of KO IDs"""
+    return get_names(args, 'ko', is_pathway=False)
+
+
+def get_pathway_names(args):
+    """Retrieve pathway names associated with a list of ko or map IDs"""
+    return get_names(args, 'pathway', is_pathway=True)
+
+
+def main(argv=None):
+    # Argument parser
+    parser = argparse.ArgumentParser(prog='kegg_lookup.py', description='Retrieve KEGG gene and pathway names')
+    add_profile_argument(parser)
+
+    # Arguments shared by the subcommands
+    parent_parser = argparse.ArgumentParser(add_help=False)
+    parent_parser.add_argument('ids_file', help='Path to file listing one KEGG ID per line')
+    parent_parser.add_argument('out_file', help='Path to output TSV file of IDs and names')
+    parent_parser.add_argument(
+        '--kegg_dump', default=None, help='Path to a local KEGG list dump to use instead of the cache (offline mode)'
+    )
+    parent_parser.add_argument(
+        '--cache_dir',
+        default=DEFAULT_CACHE_DIR,
+        help='Directory of the cached KEGG dumps. Default: ~/.cache/bioinfo_utils/kegg',
+    )
+    parent_parser.add_argument(
+        '--ttl_days', type=float, default=30, help='Re-download cached KEGG dumps older than this many days. Default: 30'
+    )
+
+    subparsers = parser.add_subparsers()
+    subparsers.metavar = 'Sub-commands:'
+
+    # 1st subcommand
+    parser_fxn1 = subparsers.add_parser('genes', parents=[parent_parser], help='Get gene names of KO IDs (KEGG list/ko)')
+    parser_fxn1.set_defaults(func=get_gene_names)
+
+    # 2nd subcommand
+    parser_fxn2 = subparsers.add_parser(
+        'pathways', parents=[parent_parser], help='Get pathway names of ko or map IDs (KEGG list/pathway)'
+    )
+    parser_fxn2.set_defaults(func=get_pathway_names)
+
+    args = parser.parse_args(argv)
+
+    start_profiling('kegg_lookup', args.profile, args.func.__name__)
+    args.func(args)
+    finish_profiling()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-#!/home/bdhingpit/miniconda3/envs/my_bioinfo_env/bin/python
+#!/usr/bin/env python3
 
 """
 For practice only. Visualize as a stacked bar plot a profile (e.g. taxonomic profile)
@@ -7,18 +7,27 @@ CLI-based utility to
 """
 
 
-import plotly.express as px
 import pandas as pd
 import argparse
-import colorlover as cl
+import os
 import random
+from concurrent.futures import ProcessPoolExecutor
 from warnings import simplefilter
+from bioinfo_utils_profiling import add_profile_argument, finish_profiling, record_stage, start_profiling
 
 
-# def check_metadata_var_in_profile_table(profile_df, metadata_df):
-#     # Check if the metadata variables are present in the profile table
-#     # Metadata variables are used to group together the samples accordingly
-#     pass
+def check_metadata_var_in_profile_table(profile_df, metadata_df, group_by):
+    """Check if the metadata variable used to group the samples is present in the profile table"""
+    metadata_vars = list(metadata_df.columns[1:])
+
+    if group_by not in metadata_vars or group_by not in profile_df.columns:
+        raise Exception(
+            "Exiting - Metadata variable {} is not in both the metadata and profile tables. Choices: {}".format(
+                group_by, ", ".join(metadata_vars)
+            )
+        )
+
+    return True
 
 
 def normalize_table(profile_df, metadata_df):
@@ -37,6 +46,66 @@ def normalize_table(profile_df, metadata_df):
     return profile_df
 
 
+def aggregate_samples(profile_df, metadata_df, group_by):
+    """Average the normalized profile of the samples sharing the same value of a metadata variable"""
+    num_vars = len(metadata_df.columns[1:])
+
+    sample_col = profile_df.columns[0]
+    features_col = list(profile_df.columns[1:-num_vars])
+    metadata_col = list(profile_df.columns[-num_vars:])
+
+    grouped_profile = profile_df.groupby(group_by, sort=False)
+    group_names = grouped_profile[metadata_col].first()
+
+    # The groups take the place of the samples
+    agg_profile_df = pd.concat(
+        [
+            pd.Series(group_names.index.astype(str), index=group_names.index, name=sample_col),
+            grouped_profile[features_col].mean(),
+            group_names,
+        ],
+        axis=1,
+    )
+
+    return agg_profile_df.reset_index(drop=True)
+
+
+def collapse_features(profile_df, metadata_df, top_n=None, min_abund=None):
+    """Collapse the features outside the top N or below the mean % abundance threshold into \"Other\""""
+    num_vars = len(metadata_df.columns[1:])
+
+    sample_col = profile_df.columns[0]
+    features_col = list(profile_df.columns[1:-num_vars])
+    metadata_col = list(profile_df.columns[-num_vars:])
+
+    # Rank features by their mean abundance across samples
+    mean_abund = profile_df[features_col].mean(axis=0).sort_values(ascending=False)
+    kept_features = mean_abund.index
+
+    if top_n is not None:
+        kept_features = kept_features[:top_n]
+
+    if min_abund is not None:
+        kept_features = kept_features[mean_abund[kept_features] >= min_abund]
+
+    other_features = mean_abund.index.difference(kept_features, sort=False)
+
+    # A feature already named "Other" is merged with the collapsed ones
+    if len(other_features) and "Other" in kept_features:
+        kept_features = kept_features.drop("Other")
+        other_features = other_features.append(pd.Index(["Other"]))
+
+    collapsed_profile_df = profile_df[[sample_col] + list(kept_features)].copy()
+
+    # Nothing to collapse, e.g. when all features are in the top N
+    if len(other_features):
+        collapsed_profile_df["Other"] = profile_df[other_features].sum(axis=1)
+
+    collapsed_profile_df = pd.concat([collapsed_profile_df, profile_df[metadata_col]], axis=1)
+
+    return collapsed_profile_df
+
+
 def melt_feature_table(profile_df, metadata_df):
     """Melt profile using sample names/columns as IDs"""
     num_vars = len(metadata_df.columns[1:])
@@ -47,6 +116,9 @@ def melt_feature_table(profile_df, metadata_df):
 
     melt_profile_df = pd.melt(profile_df, id_vars=[sample_col], value_vars=features_col, var_name="Features")
 
+    # Zero-abundance bar segments are not drawn anyway
+    melt_profile_df = melt_profile_df[melt_profile_df["value"] > 0]
+
     return melt_profile_df
 
 
@@ -73,32 +145,150 @@ def define_layout(fig):
 
 def create_stacked_barplot(profile_df):
     """Create the stacked barplot"""
+    import plotly.express as px
+    import colorlover as cl
+
     # Define color scale for bars
     col_scale = cl.scales["10"]["div"]["Spectral"]
     col_scale_features = cl.interp(col_scale, len(profile_df["Features"].unique()))
     random.Random(4).shuffle(col_scale_features)
 
-    fig = px.bar(profile_df, x="index", y="value", color="Features", color_discrete_sequence=col_scale_features)
+    fig = px.bar(
+        profile_df,
+        x="index",
+        y="value",
+        color="Features",
+        color_discrete_sequence=col_scale_features,
+        color_discrete_map={"Other": "#d3d3d3"},
+    )
     fig = define_layout(fig)
-    fig.show()
 
     return fig
 
 
-def main(args):
+def plot_profile(profile, metadata, top_n=None, min_abund=None, group_by=None):
+    """Load, normalize and reduce a profile table, then create its stacked barplot"""
     simplefilter(action="ignore", category=pd.errors.PerformanceWarning)
 
-    profile_df = pd.read_csv(args.profile, sep="\t")
-    metadata_df = pd.read_csv(args.metadata, sep="\t", comment="#")
+    profile_df = pd.read_csv(profile, sep="\t")
+    metadata_df = pd.read_csv(metadata, sep="\t", comment="#")
+    record_stage('load', len(profile_df))
 
     norm_profile_df = normalize_table(profile_df, metadata_df)
+
+    # Reduce the data before plotting
+    if group_by is not None:
+        check_metadata_var_in_profile_table(norm_profile_df, metadata_df, group_by)
+        norm_profile_df = aggregate_samples(norm_profile_df, metadata_df, group_by)
+
+    if top_n is not None or min_abund is not None:
+        norm_profile_df = collapse_features(norm_profile_df, metadata_df, top_n, min_abund)
+
     melt_profile_df = melt_feature_table(norm_profile_df, metadata_df)
+    record_stage('normalize_and_reduce', len(profile_df))
+
     fig = create_stacked_barplot(melt_profile_df)
+    record_stage('plot', len(melt_profile_df))
 
-    fig.write_html("./stacked_barplot.html")
+    return fig
 
 
-if __name__ == "__main__":
+def render_profile(profile, metadata, out_html, top_n=None, min_abund=None, group_by=None, include_plotlyjs=True):
+    """Write the stacked barplot of a profile table to HTML without displaying it"""
+    fig = plot_profile(profile, metadata, top_n, min_abund, group_by)
+    fig.write_html(out_html, include_plotlyjs=include_plotlyjs)
+
+    return out_html
+
+
+def get_output_names(profiles):
+    """Name each output after its profile file, prefixed with its directories when file names collide"""
+    names = [os.path.splitext(os.path.basename(profile))[0] for profile in profiles]
+
+    if len(set(names)) < len(names):
+        # e.g. p1/genus.tsv and p2/genus.tsv -> p1_genus and p2_genus
+        abs_profiles = [os.path.abspath(profile) for profile in profiles]
+        common_dir = os.path.commonpath([os.path.dirname(profile) for profile in abs_profiles])
+        names = [
+            os.path.splitext(os.path.relpath(profile, common_dir))[0].replace(os.sep, "_") for profile in abs_profiles
+        ]
+
+    if len(set(names)) < len(names):
+        raise Exception(
+            "Exiting - Profile tables given more than once: {}".format(
+                ", ".join(sorted(set(name for name in names if names.count(name) > 1)))
+            )
+        )
+
+    return names
+
+
+def render_profiles_batch(profiles, metadata, out_dir, top_n=None, min_abund=None, group_by=None, threads=1):
+    """Render the stacked barplots of many profile tables in parallel, all sharing one plotly.js file"""
+    import plotly.offline
+
+    # One metadata file for all profiles, or one per profile (e.g. for profiles of different projects)
+    if len(metadata) == 1:
+        metadata = metadata * len(profiles)
+    elif len(metadata) != len(profiles):
+        raise Exception("Exiting - Give either one metadata file or one per profile table")
+
+    out_names = get_output_names(profiles)
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Write plotly.js once; each HTML file links to it instead of embedding it
+    with open(os.path.join(out_dir, "plotly.min.js"), "w") as plotly_js:
+        plotly_js.write(plotly.offline.get_plotlyjs())
+
+    with ProcessPoolExecutor(max_workers=threads) as executor:
+        futures = [
+            executor.submit(
+                render_profile,
+                profile,
+                profile_metadata,
+                os.path.join(out_dir, out_name + ".html"),
+                top_n,
+                min_abund,
+                group_by,
+                "plotly.min.js",
+            )
+            for profile, profile_metadata, out_name in zip(profiles, metadata, out_names)
+        ]
+        out_htmls = [future.result() for future in futures]
+
+    record_stage('render', len(profiles))
+
+    return out_htmls
+
+
+def main(args):
+    simplefilter(action="ignore", category=pd.errors.PerformanceWarning)
+    start_profiling('profile_to_stacked_barplot', args.profile_report)
+
+    if args.out_dir is not None:
+        render_profiles_batch(
+            args.profile, args.metadata, args.out_dir, args.top_n, args.min_abund, args.group_by, args.threads
+        )
+        finish_profiling()
+        return None
+
+    if len(args.profile) > 1 or len(args.metadata) > 1:
+        raise Exception("Exiting - Use --out_dir to render several profile tables")
+
+    fig = plot_profile(args.profile[0], args.metadata[0], args.top_n, args.min_abund, args.group_by)
+
+    if not args.headless:
+        fig.show()
+
+    fig.write_html(args.out)
+    record_stage('write')
+
+    finish_profiling()
+
+
+def cli(argv=None):
+    """Parse the command line arguments and run the utility"""
     parent_parser = argparse.ArgumentParser(
         formatter_class=argparse.RawTextHelpFormatter,
         description="Produce interactive stacked barplot from a feature table profile",
@@ -109,7 +299,13 @@ if __name__ == "__main__":
     required_args = parent_parser.add_argument_group('Required arguments')
 
     required_args.add_argument(
-        "--profile", dest="profile", type=str, required=True, metavar="STRING", help="Path to profile table in TSV format"
+        "--profile",
+        dest="profile",
+        type=str,
+        nargs="+",
+        required=True,
+        metavar="STRING",
+        help="Path to profile table in TSV format. Several tables (e.g. one per rank) can be given with --out_dir",
     )
 
     required_args.add_argument(
@@ -123,9 +319,94 @@ if __name__ == "__main__":
     )
 
     required_args.add_argument(
-        "--metadata", dest="metadata", type=str, required=True, metavar="STRING", help="Path to metadata file in TSV format"
+        "--metadata",
+        dest="metadata",
+        type=str,
+        nargs="+",
+        required=True,
+        metavar="STRING",
+        help="Path to metadata file in TSV format. With several profile tables, either one file shared by all\n"
+        "or one per profile table, in the same order",
+    )
+
+    # Define optional arguments to reduce the data before plotting
+    optional_args = parent_parser.add_argument_group('Optional arguments')
+
+    optional_args.add_argument(
+        "--top_n",
+        dest="top_n",
+        type=int,
+        required=False,
+        default=None,
+        metavar="INTEGER",
+        help="Number of most abundant features to plot; the rest are collapsed into \"Other\"",
     )
 
-    args = parent_parser.parse_args()
+    optional_args.add_argument(
+        "--min_abund",
+        dest="min_abund",
+        type=float,
+        required=False,
+        default=None,
+        metavar="FLOAT",
+        help="Minimum mean %% abundance of a feature to be plotted; the rest are collapsed into \"Other\"",
+    )
+
+    optional_args.add_argument(
+        "--group_by",
+        dest="group_by",
+        type=str,
+        required=False,
+        default=None,
+        metavar="STRING",
+        help="Metadata variable used to average together the samples of the same group",
+    )
+
+    # Define optional arguments for the output
+    output_args = parent_parser.add_argument_group('Output arguments')
+
+    output_args.add_argument(
+        "--out",
+        dest="out",
+        type=str,
+        required=False,
+        default="./stacked_barplot.html",
+        metavar="STRING",
+        help="Path to output HTML file of a single profile table. Default: \"./stacked_barplot.html\"",
+    )
+
+    output_args.add_argument(
+        "--out_dir",
+        dest="out_dir",
+        type=str,
+        required=False,
+        default=None,
+        metavar="STRING",
+        help="Render all profile tables headlessly into this directory as <profile name>.html,\n"
+        "sharing a single plotly.min.js file. Profiles with the same file name are prefixed with their directories",
+    )
+
+    output_args.add_argument(
+        "--headless", dest="headless", action="store_true", help="Only write the HTML file, do not open the plot"
+    )
+
+    output_args.add_argument(
+        "--threads",
+        dest="threads",
+        type=int,
+        required=False,
+        default=1,
+        metavar="INTEGER",
+        help="Number of processes used to render the profile tables given with --out_dir. Default: 1",
+    )
+
+    # --profile is the profile table here, so the profiling report has its own flag
+    add_profile_argument(parent_parser, '--profile_report', 'profile_report')
+
+    args = parent_parser.parse_args(argv)
 
     main(args)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,177 @@
+import pandas as pd
+import pytest
+
+from combine_abundance_table_and_annotation import (
+    aggregate_abundance,
+    merge_gene_tables,
+    merge_gene_tables_chunked,
+    parse_eggnog_table,
+    parse_kofamkoala_table,
+)
+from bioinfo_utils_table_io import write_table
+
+
+# featureCounts table of prodigal genes without its comment line
+GENES_ABUND_LINES = [
+    'Geneid\tChr\tStart\tEnd\tStrand\tLength\tS1\tS2\n',
+    '1_1\tcontig1\t1\t300\t+\t300\t10\t0\n',
+    '1_2\tcontig1\t400\t900\t-\t501\t3\t7\n',
+    '2_1\tcontig2\t1\t600\t+\t600\t0\t12\n',
+]
+
+KOFAMKOALA_LINES = [
+    '# gene name\tKO\tthrshld\tscore\tE-value\t"KO definition"\n',
+    '#---------\t------\t-------\t------\t---------\t-------------\n',
+    '* contig1_1\tK00001\t100.00\t250.3\t1.2e-75\t"alcohol dehydrogenase"\n',
+    '* contig1_1\tK00002\t120.00\t180.1\t3.4e-50\t"alcohol dehydrogenase (NADP+)"\n',
+    '  contig1_2\tK00003\t300.00\t20.5\t0.12\t"homoserine dehydrogenase"\n',
+    '* contig2_1\tK00004\t90.00\t95.0\t2.0e-25\t"(R,R)-butanediol dehydrogenase"\n',
+]
+
+EGGNOG_LINES = [
+    '## emapper-2.1.6\n',
+    '## command: emapper.py -i genes.faa -o out\n',
+    '##\n',
+    '#query\tseed_ortholog\tevalue\tKEGG_ko\tKEGG_Pathway\n',
+    'contig1_1\t1234.A\t1e-80\tko:K00001,ko:K00002\tmap00010\n',
+    'contig1_2\t1234.B\t1e-20\t-\t-\n',
+    'contig2_1\t1234.C\t1e-50\tko:K00004\t-\n',
+    '## 3 queries scanned\n',
+]
+
+
+@pytest.fixture
+def gene_tables(tmp_path):
+    abund_table = tmp_path / 'featurecounts.tsv'
+    abund_table.write_text(''.join(GENES_ABUND_LINES))
+    annot_table = tmp_path / 'kofamkoala.txt'
+    annot_table.write_text(''.join(KOFAMKOALA_LINES))
+
+    return str(abund_table), str(annot_table)
+
+
+@pytest.mark.parametrize('out_name', ['merged.parquet', 'merged.feather', 'merged.h5'])
+def test_chunked_merge_rejects_binary_output_before_writing(tmp_path, gene_tables, out_name):
+    out = tmp_path / out_name
+
+    with pytest.raises(Exception, match='can only be saved as TSV'):
+        merge_gene_tables_chunked(*gene_tables, 'kofamkoala', str(out), chunksize=1)
+
+    assert not out.exists()
+
+
+@pytest.mark.parametrize(
+    'expand_kos, expected',
+    [
+        (False, [['contig1_1', 'K00001'], ['contig2_1', 'K00004']]),
+        (True, [['contig1_1', 'K00001'], ['contig1_1', 'K00002'], ['contig2_1', 'K00004']]),
+    ],
+)
+def test_parse_eggnog_table(tmp_path, expand_kos, expected):
+    annot_table = tmp_path / 'eggnog.emapper.annotations'
+    annot_table.write_text(''.join(EGGNOG_LINES))
+
+    annot_df = parse_eggnog_table(str(annot_table), expand_kos)
+
+    assert annot_df.columns.tolist() == ['Gene_name', 'Annotation']
+    assert annot_df.values.tolist() == expected
+
+
+def test_parse_eggnog_table_without_query_header(tmp_path):
+    # eggNOG-mapper v2.0 header
+    annot_table = tmp_path / 'eggnog.emapper.annotations'
+    annot_table.write_text(''.join(EGGNOG_LINES).replace('#query\t', '#query_name\t'))
+
+    with pytest.raises(Exception, match='No "#query" header line'):
+        parse_eggnog_table(str(annot_table))
+
+
+@pytest.mark.parametrize(
+    'expand_kos, expected',
+    [
+        (False, [['contig1_1', 'K00001'], ['contig2_1', 'K00004']]),
+        (True, [['contig1_1', 'K00001'], ['contig1_1', 'K00002'], ['contig2_1', 'K00004']]),
+    ],
+)
+def test_parse_kofamkoala_table(gene_tables, expand_kos, expected):
+    annot_df = parse_kofamkoala_table(gene_tables[1], expand_kos)
+
+    assert annot_df.columns.tolist() == ['Gene_name', 'Annotation']
+    assert annot_df.values.tolist() == expected
+
+
+def assert_matches_groupby(merged_df, group_by, sample_cols, feature_names, sample_names, feature_sample_mat):
+    expected_df = merged_df.groupby(group_by, sort=False)[sample_cols].sum()
+    aggregated_df = pd.DataFrame(feature_sample_mat.toarray(), index=feature_names, columns=sample_names)
+
+    pd.testing.assert_frame_equal(aggregated_df, expected_df.astype(float), check_names=False)
+
+
+@pytest.mark.parametrize('chunksize', [2, 3, 100])
+def test_aggregate_matches_groupby_sum(tmp_path, chunksize):
+    # Rows 3-4 form a chunk of unannotated genes when read 2 rows at a time
+    merged_df = pd.DataFrame(
+        {
+            'Annotation': ['K00001', 'K00002', None, None, 'K00001', 'K00003', 'K00002'],
+            'Gene_name': ['c1_1', 'c1_2', 'c1_3', 'c2_1', 'c2_2', 'c3_1', 'c3_2'],
+            'S1': [1, 0, 5, 2, 3, 0, 4],
+            'S2': [0.5, 2.0, 1.0, 0.0, 0.0, 7.5, 1.0],
+        }
+    )
+    merged_table = tmp_path / 'merged.tsv'
+    merged_df.to_csv(merged_table, sep='\t', index=False)
+
+    aggregated = aggregate_abundance(str(merged_table), 'Annotation', chunksize=chunksize)
+
+    assert aggregated[1] == ['S1', 'S2']
+    assert_matches_groupby(merged_df, 'Annotation', ['S1', 'S2'], *aggregated)
+
+
+def test_aggregate_contigs_table_skips_taxon_id(tmp_path):
+    merged_df = pd.DataFrame(
+        {
+            'Contig': ['c1', 'c2', 'c3'],
+            'TaxonID': [562, 1280, 562],
+            'TaxonLevel': ['species', 'species', 'species'],
+            'TaxonName': ['Escherichia coli', 'Staphylococcus aureus', 'Escherichia coli'],
+            'TaxonLineage': ['d_Bacteria;s_Escherichia coli', 'd_Bacteria;s_Staphylococcus aureus', 'd_Bacteria'],
+            'S1': [10, 20, 30],
+        }
+    )
+    merged_table = tmp_path / 'merged.tsv'
+    merged_df.to_csv(merged_table, sep='\t', index=False)
+
+    aggregated = aggregate_abundance(str(merged_table), 'TaxonName', chunksize=2)
+
+    assert aggregated[1] == ['S1']
+    assert_matches_groupby(merged_df, 'TaxonName', ['S1'], *aggregated)
+
+
+def test_aggregate_without_annotations(tmp_path):
+    merged_table = tmp_path / 'merged.tsv'
+    pd.DataFrame({'Annotation': [None, None], 'Gene_name': ['c1_1', 'c1_2'], 'S1': [1, 2]}).to_csv(
+        merged_table, sep='\t', index=False
+    )
+
+    feature_names, sample_names, feature_sample_mat = aggregate_abundance(str(merged_table), 'Annotation', chunksize=1)
+
+    assert feature_names == [] and sample_names == ['S1']
+    assert feature_sample_mat.shape == (0, 1)
+
+
+@pytest.mark.parametrize('chunksize', [1, 2, 100])
+@pytest.mark.parametrize('annot_mode, expand_kos', [('kofamkoala', False), ('kofamkoala', True), ('eggnog', True)])
+def test_chunked_merge_matches_in_memory_merge(tmp_path, gene_tables, chunksize, annot_mode, expand_kos):
+    abund_table, annot_table = gene_tables
+
+    if annot_mode == 'eggnog':
+        annot_table = str(tmp_path / 'eggnog.emapper.annotations')
+        with open(annot_table, 'w') as annot_file:
+            annot_file.write(''.join(EGGNOG_LINES))
+
+    write_table(merge_gene_tables(abund_table, annot_table, annot_mode, expand_kos), str(tmp_path / 'merged.tsv'))
+    merge_gene_tables_chunked(
+        abund_table, annot_table, annot_mode, str(tmp_path / 'chunked.tsv'), chunksize, expand_kos
+    )
+
+    assert (tmp_path / 'chunked.tsv').read_text() == (tmp_path / 'merged.tsv').read_text()
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from featurecounts_to_tpm import calc_tmm_factors, get_output_path, main, normalize_featurecounts
+
+
+# Low counts with many ties; the expected factors follow edgeR's calcNormFactors(method="TMM"), which ranks tied
+# log-ratios and abundances by their average rank
+TIED_COUNTS = np.array(
+    [
+        [3, 1, 2, 0],
+        [2, 2, 5, 1],
+        [4, 3, 3, 2],
+        [0, 1, 0, 3],
+        [3, 3, 4, 3],
+        [5, 2, 6, 2],
+        [1, 1, 1, 1],
+        [2, 4, 2, 5],
+        [6, 3, 7, 2],
+        [3, 2, 3, 3],
+        [0, 0, 0, 0],
+        [2, 3, 1, 4],
+    ],
+    dtype=np.float64,
+)
+
+EDGER_TMM_FACTORS = [0.99625916, 0.99019981, 0.96321299, 1.05240404]
+
+
+def test_tmm_factors_match_edger_with_ties():
+    np.testing.assert_allclose(calc_tmm_factors(TIED_COUNTS.copy()), EDGER_TMM_FACTORS, rtol=1e-7)
+
+
+def test_tmm_factors_are_one_for_proportional_samples():
+    # All log-ratios are zero, so edgeR returns a factor of 1 for every sample
+    counts = np.array([[10, 20], [3, 6], [7, 14], [0, 0], [5, 10]], dtype=np.float64)
+
+    np.testing.assert_allclose(calc_tmm_factors(counts), [1, 1])
+
+
+def test_tmm_factors_multiply_to_one():
+    counts = np.random.default_rng(0).poisson(3, size=(500, 5)).astype(np.float64)
+
+    assert np.isclose(np.prod(calc_tmm_factors(counts)), 1)
+
+
+@pytest.mark.parametrize('out_name', ['tpm.parquet', 'tpm.feather', 'tpm.h5'])
+def test_chunked_normalization_rejects_binary_output_before_writing(tmp_path, out_name):
+    featurecounts_table = tmp_path / 'featurecounts.tsv'
+    featurecounts_table.write_text(
+        '# Program:featureCounts v2.0.1\n'
+        'Geneid\tChr\tStart\tEnd\tStrand\tLength\tS1\n'
+        '1_1\tcontig1\t1\t300\t+\t300\t10\n'
+        '1_2\tcontig1\t400\t900\t-\t501\t3\n'
+    )
+    out = tmp_path / out_name
+
+    with pytest.raises(Exception, match='can only be saved as TSV'):
+        main([str(featurecounts_table)], str(out), chunksize=1)
+
+    assert not out.exists()
+
+
+def test_normalize_single_sample_table(tmp_path):
+    featurecounts_table = tmp_path / 'featurecounts.tsv'
+    featurecounts_table.write_text(
+        '# Program:featureCounts v2.0.1\n'
+        'Geneid\tChr\tStart\tEnd\tStrand\tLength\tS1\n'
+        '1_1\tcontig1\t1\t1000\t+\t1000\t10\n'
+        '1_2\tcontig1\t1001\t1500\t-\t500\t15\n'
+    )
+
+    normalized_dfs = normalize_featurecounts(str(featurecounts_table), ['cpm', 'tpm'])
+
+    np.testing.assert_allclose(normalized_dfs['cpm']['S1'], [400000, 600000])
+    np.testing.assert_allclose(normalized_dfs['tpm']['S1'], [250000, 750000])
+
+
+FEATURECOUNTS_HEADER = '# Program:featureCounts v2.0.1\nGeneid\tChr\tStart\tEnd\tStrand\tLength\t{}\n'
+
+GENE_ROWS = ['1_1\tcontig1\t1\t1000\t+\t1000\t{}\n', '1_2\tcontig1\t1001\t1500\t-\t500\t{}\n']
+
+
+def write_featurecounts(path, samples, gene_rows):
+    path.write_text(FEATURECOUNTS_HEADER.format('\t'.join(samples)) + ''.join(gene_rows))
+
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    'methods, expected_names', [(['tpm'], ['merged.tsv']), (['tpm', 'cpm'], ['merged.cpm.tsv', 'merged.tpm.tsv'])]
+)
+def test_batch_normalization_merges_tables(tmp_path, methods, expected_names):
+    featurecounts_tables = [
+        write_featurecounts(
+            tmp_path / 'fc1.tsv', ['S1', 'S2'], [GENE_ROWS[0].format('10\t1'), GENE_ROWS[1].format('15\t2')]
+        ),
+        # Same genes in another order
+        write_featurecounts(tmp_path / 'fc2.tsv', ['S3'], [GENE_ROWS[1].format('5'), GENE_ROWS[0].format('0')]),
+    ]
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+
+    main(featurecounts_tables, str(out_dir / 'merged.tsv'), methods=methods, threads=2)
+
+    assert sorted(path.name for path in out_dir.iterdir()) == expected_names
+
+    for method in methods:
+        merged_df = pd.read_csv(get_output_path(str(out_dir / 'merged.tsv'), method, len(methods)), sep='\t')
+
+        assert merged_df.columns.tolist() == ['Geneid', 'Chr', 'Start', 'End', 'Strand', 'Length', 'S1', 'S2', 'S3']
+        assert merged_df['Geneid'].tolist() == ['1_1', '1_2']
+
+    np.testing.assert_allclose(merged_df['S3'], [0, 1000000])
+
+
+def test_batch_normalization_rejects_different_genes(tmp_path):
+    featurecounts_tables = [
+        write_featurecounts(tmp_path / 'fc1.tsv', ['S1'], [GENE_ROWS[0].format('10'), GENE_ROWS[1].format('15')]),
+        write_featurecounts(
+            tmp_path / 'fc2.tsv', ['S2'], [GENE_ROWS[0].format('10'), GENE_ROWS[1].replace('1001', '1002').format('5')]
+        ),
+    ]
+
+    with pytest.raises(Exception, match='Gene annotations of .*fc2.tsv differ from those of .*fc1.tsv'):
+        main(featurecounts_tables, str(tmp_path / 'merged.tsv'), threads=2)
+
+    assert not (tmp_path / 'merged.tsv').exists()
+
+
+def test_batch_normalization_rejects_repeated_samples(tmp_path):
+    featurecounts_tables = [
+        write_featurecounts(tmp_path / 'fc1.tsv', ['S1'], [GENE_ROWS[0].format('10'), GENE_ROWS[1].format('15')]),
+        write_featurecounts(tmp_path / 'fc2.tsv', ['S1'], [GENE_ROWS[0].format('3'), GENE_ROWS[1].format('5')]),
+    ]
+
+    with pytest.raises(Exception, match='Sample S1 is in both'):
+        main(featurecounts_tables, str(tmp_path / 'merged.tsv'), threads=2)
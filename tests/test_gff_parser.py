@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+from gff_parser import main
+
+
+GFF_LINES = [
+    'chr2\tsrc\tgene\t50\t90\t.\t+\t.\tID=g2\n',
+    'chr1\tsrc\tmRNA\t30\t80\t.\t+\t.\tID=m1;Parent=g1\n',
+    'chr1\tsrc\tgene\t10\t80\t.\t+\t.\tID=g1\n',
+]
+
+
+def test_sort_crlf_gff_keeps_fasta_section(tmp_path):
+    gff = tmp_path / 'crlf.gff'
+    gff_text = ''.join(['##gff-version 3\n'] + GFF_LINES + ['##FASTA\n', '>chr1\n', 'ACGT\n'])
+    gff.write_bytes(gff_text.replace('\n', '\r\n').encode())
+
+    main(['sort', str(gff), str(tmp_path / 'crlf'), '--max_memory', '1', '--strict'])
+
+    assert (tmp_path / 'crlf_SORTED.gff').read_text().splitlines() == [
+        '##gff-version 3',
+        GFF_LINES[2].rstrip(),
+        GFF_LINES[1].rstrip(),
+        GFF_LINES[0].rstrip(),
+        '##FASTA',
+        '>chr1',
+        'ACGT',
+    ]
+
+
+def test_sort_strict_leaves_no_output(tmp_path):
+    gff = tmp_path / 'invalid.gff'
+    invalid_lines = ['chr3\tsrc\tgene\t5\t9\t.\t+\t.\tID=g2\n', 'chr3\tsrc\tmRNA\t5\t9\t.\t+\t.\tParent=g9\n']
+    gff.write_text(''.join(GFF_LINES + invalid_lines))
+
+    with pytest.raises(Exception, match='Duplicate IDs: g2. Missing Parents: g9'):
+        main(['sort', str(gff), str(tmp_path / 'invalid'), '--strict'])
+
+    assert list(tmp_path.iterdir()) == [gff]
+
+
+# CDS ATG AAA TGG GGC TAA (MKWG*) split over two exons, placed on the plus strand of chr1 and the minus strand of chr2
+EXON1, INTRON, EXON2 = 'ATGAAAT', 'CCCCCCCC', 'GGGGCTAA'
+CHR1 = 'TTTTT' + EXON1 + INTRON + EXON2 + 'TTTTT'
+CHR2 = CHR1[::-1].translate(str.maketrans('ACGT', 'TGCA'))
+
+SPLIT_CDS_LINES = [
+    'chr1\tsrc\tCDS\t6\t12\t.\t+\t0\tID=cds1;Parent=m1\n',
+    'chr1\tsrc\tCDS\t21\t28\t.\t+\t2\tID=cds1;Parent=m1\n',
+    'chr2\tsrc\tCDS\t6\t13\t.\t-\t2\tID=cds2a;Parent=m2\n',
+    'chr2\tsrc\tCDS\t22\t28\t.\t-\t0\tID=cds2b;Parent=m2\n',
+]
+
+
+def write_fasta(fasta, line_width):
+    fasta_lines = []
+    for seq_name, seq in [('chr1', CHR1), ('chr2', CHR2)]:
+        fasta_lines.append('>{} description\n'.format(seq_name))
+        fasta_lines.extend(seq[i : i + line_width] + '\n' for i in range(0, len(seq), line_width))
+
+    fasta.write_text(''.join(fasta_lines))
+
+
+def extract(tmp_path, gff_lines, *options):
+    gff = tmp_path / 'features.gff'
+    gff.write_text(''.join(gff_lines))
+
+    main(['extract_seqs', str(gff), str(tmp_path / 'genome.fna'), str(tmp_path / 'out')] + list(options))
+
+    out_ext = '.faa' if '--translate' in options else '.fna'
+
+    return (tmp_path / ('out_EXTRACTED' + out_ext)).read_text().splitlines()
+
+
+def test_extract_plus_and_minus_strand_across_line_breaks(tmp_path):
+    write_fasta(tmp_path / 'genome.fna', 10)
+    gff_lines = [
+        'chr1\tsrc\tgene\t8\t13\t.\t+\t.\tID=plus\n',
+        'chr2\tsrc\tgene\t22\t28\t.\t-\t.\tID=minus\n',
+    ]
+
+    assert extract(tmp_path, gff_lines) == ['>plus', 'GAAATC', '>minus', EXON1]
+
+
+def test_extract_translates_from_phase(tmp_path):
+    write_fasta(tmp_path / 'genome.fna', 10)
+    gff_lines = ['chr1\tsrc\tCDS\t5\t12\t.\t+\t1\tID=cds0\n']
+
+    assert extract(tmp_path, gff_lines, '--translate') == ['>cds0', 'MK']
+
+
+def test_extract_translates_split_cds_on_both_strands(tmp_path):
+    write_fasta(tmp_path / 'genome.fna', 10)
+
+    assert extract(tmp_path, SPLIT_CDS_LINES, '--translate') == ['>cds1', 'MKWG*', '>m2', 'MKWG*']
+
+
+def test_extract_rebuilds_outdated_index(tmp_path):
+    fasta = tmp_path / 'genome.fna'
+    write_fasta(fasta, 10)
+    extract(tmp_path, SPLIT_CDS_LINES, '--translate')
+
+    # Rewrapping the FASTA changes every offset of the index
+    write_fasta(fasta, 7)
+    fasta_mtime = os.path.getmtime(str(fasta) + '.fai') + 10
+    os.utime(fasta, (fasta_mtime, fasta_mtime))
+
+    assert extract(tmp_path, SPLIT_CDS_LINES, '--translate') == ['>cds1', 'MKWG*', '>m2', 'MKWG*']
@@ -0,0 +1,70 @@
+import http.client
+import os
+
+import pytest
+
+import kegg_lookup
+from kegg_lookup import clean_kegg_id, get_kegg_list_file, load_kegg_list, lookup_kegg_names, main
+
+
+KO_DUMP = 'K00001\tE1.1.1.1, adh; alcohol dehydrogenase [EC:1.1.1.1]\nK00002\tAKR1A1; alcohol dehydrogenase (NADP+)\n'
+
+PATHWAY_DUMP = 'map00010\tGlycolysis / Gluconeogenesis\nmap00020\tCitrate cycle (TCA cycle)\n'
+
+
+@pytest.mark.parametrize(
+    'kegg_id, expected',
+    [('ko:K00001', 'K00001'), ('path:map00010', 'map00010'), ('map:map00020', 'map00020'), (' K00002\n', 'K00002')],
+)
+def test_clean_kegg_id(kegg_id, expected):
+    assert clean_kegg_id(kegg_id) == expected
+
+
+def test_lookup_pathway_names_maps_ko_to_map_ids(tmp_path):
+    kegg_dump = tmp_path / 'pathway.tsv'
+    kegg_dump.write_text(PATHWAY_DUMP)
+
+    kegg_names = lookup_kegg_names(
+        ['ko00010', 'path:map00020', 'ko99999'], load_kegg_list(str(kegg_dump)), is_pathway=True
+    )
+
+    assert kegg_names == ['Glycolysis / Gluconeogenesis', 'Citrate cycle (TCA cycle)', '']
+
+
+def test_genes_with_local_dump(tmp_path):
+    kegg_dump = tmp_path / 'ko.tsv'
+    kegg_dump.write_text(KO_DUMP)
+    ids_file = tmp_path / 'ids.txt'
+    ids_file.write_text('ko:K00002\nK00003\n')
+    out_file = tmp_path / 'names.tsv'
+
+    main(['genes', str(ids_file), str(out_file), '--kegg_dump', str(kegg_dump)])
+
+    assert out_file.read_text() == 'ko:K00002\tAKR1A1; alcohol dehydrogenase (NADP+)\nK00003\t\n'
+
+
+@pytest.mark.parametrize('error', [OSError('Network is unreachable'), http.client.IncompleteRead(b'')])
+def test_expired_cache_is_used_when_download_fails(tmp_path, monkeypatch, capsys, error):
+    cache_file = tmp_path / 'ko.tsv'
+    cache_file.write_text(KO_DUMP)
+    # Make the cache 2 days old, past a 1 day TTL
+    expired_time = os.path.getmtime(cache_file) - 2 * 86400
+    os.utime(cache_file, (expired_time, expired_time))
+
+    def fail_download(list_name, cache_file):
+        raise error
+
+    monkeypatch.setattr(kegg_lookup, 'download_kegg_list', fail_download)
+
+    assert get_kegg_list_file('ko', str(tmp_path), ttl_days=1) == str(cache_file)
+    assert 'using the existing one' in capsys.readouterr().err
+
+
+def test_download_failure_without_cache_is_raised(tmp_path, monkeypatch):
+    def fail_download(list_name, cache_file):
+        raise OSError('Network is unreachable')
+
+    monkeypatch.setattr(kegg_lookup, 'download_kegg_list', fail_download)
+
+    with pytest.raises(OSError):
+        get_kegg_list_file('ko', str(tmp_path))
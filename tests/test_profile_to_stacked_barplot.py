@@ -0,0 +1,111 @@
+import pandas as pd
+import pytest
+
+from profile_to_stacked_barplot import collapse_features, get_output_names, render_profiles_batch
+
+
+METADATA_DF = pd.DataFrame({'sample-id': ['s1', 's2'], 'Site': ['gut', 'soil']})
+
+
+def make_profile_df(features):
+    profile_df = pd.DataFrame({'index': ['s1', 's2']})
+
+    for feature, abundances in features.items():
+        profile_df[feature] = abundances
+
+    profile_df['Site'] = ['gut', 'soil']
+
+    return profile_df
+
+
+def test_collapse_top_n_into_other():
+    profile_df = make_profile_df({'A': [50.0, 10.0], 'B': [5.0, 5.0], 'C': [40.0, 60.0], 'D': [5.0, 25.0]})
+
+    collapsed_df = collapse_features(profile_df, METADATA_DF, top_n=2)
+
+    assert collapsed_df.columns.tolist() == ['index', 'C', 'A', 'Other', 'Site']
+    assert collapsed_df['Other'].tolist() == [10.0, 30.0]
+
+
+def test_collapse_min_abund_into_other():
+    profile_df = make_profile_df({'A': [50.0, 10.0], 'B': [5.0, 5.0], 'C': [40.0, 60.0], 'D': [5.0, 25.0]})
+
+    collapsed_df = collapse_features(profile_df, METADATA_DF, min_abund=10)
+
+    assert collapsed_df.columns.tolist() == ['index', 'C', 'A', 'D', 'Other', 'Site']
+    assert collapsed_df['Other'].tolist() == [5.0, 5.0]
+
+
+@pytest.mark.parametrize('top_n, min_abund', [(4, None), (10, None), (None, 1)])
+def test_collapse_nothing_adds_no_other(top_n, min_abund):
+    profile_df = make_profile_df({'A': [50.0, 10.0], 'B': [5.0, 5.0], 'C': [40.0, 60.0], 'D': [5.0, 25.0]})
+
+    collapsed_df = collapse_features(profile_df, METADATA_DF, top_n, min_abund)
+
+    assert collapsed_df.columns.tolist() == ['index', 'C', 'A', 'D', 'B', 'Site']
+
+
+@pytest.mark.parametrize('top_n, expected_other', [(3, [35.0, 35.0]), (1, [50.0, 70.0])])
+def test_collapse_merges_existing_other(top_n, expected_other):
+    # "Other" is the 2nd most abundant feature
+    profile_df = make_profile_df({'A': [50.0, 30.0], 'Other': [30.0, 30.0], 'B': [5.0, 5.0], 'C': [15.0, 35.0]})
+
+    collapsed_df = collapse_features(profile_df, METADATA_DF, top_n=top_n)
+
+    assert collapsed_df.columns.tolist().count('Other') == 1
+    assert collapsed_df['Other'].tolist() == expected_other
+    assert collapsed_df.drop(columns=['index', 'Site']).sum(axis=1).tolist() == [100.0, 100.0]
+
+
+@pytest.mark.parametrize(
+    'profiles, expected',
+    [
+        (['p1/genus.tsv', 'p1/phylum.tsv'], ['genus', 'phylum']),
+        (['runs/p1/genus.tsv', 'runs/p2/genus.tsv'], ['p1_genus', 'p2_genus']),
+        (['p1/genus.tsv', 'p1/a/genus.tsv', 'p2/genus.tsv'], ['p1_genus', 'p1_a_genus', 'p2_genus']),
+    ],
+)
+def test_output_names_are_unique(profiles, expected):
+    assert get_output_names(profiles) == expected
+
+
+def test_output_names_reject_repeated_profiles():
+    with pytest.raises(Exception, match='given more than once: genus'):
+        get_output_names(['p1/genus.tsv', 'p1/../p1/genus.tsv'])
+
+
+def write_project(project_dir, metadata_vars):
+    """Write a profile table with its metadata variables and the matching metadata file"""
+    project_dir.mkdir()
+    profile_df = make_profile_df({'A': [5, 1], 'B': [3, 3]}).drop(columns='Site')
+    metadata_df = pd.DataFrame({'sample-id': ['s1', 's2']})
+
+    for var, values in metadata_vars.items():
+        profile_df[var] = values
+        metadata_df[var] = values
+
+    profile_df.to_csv(project_dir / 'genus.tsv', sep='\t', index=False)
+    metadata_df.to_csv(project_dir / 'metadata.tsv', sep='\t', index=False)
+
+    return str(project_dir / 'genus.tsv'), str(project_dir / 'metadata.tsv')
+
+
+def test_batch_with_one_metadata_per_profile(tmp_path):
+    profile1, metadata1 = write_project(tmp_path / 'p1', {'Site': ['gut', 'soil']})
+    profile2, metadata2 = write_project(tmp_path / 'p2', {'Site': ['gut', 'gut'], 'Depth': [1, 2]})
+    out_dir = tmp_path / 'plots'
+
+    out_htmls = render_profiles_batch([profile1, profile2], [metadata1, metadata2], str(out_dir))
+
+    assert out_htmls == [str(out_dir / 'p1_genus.html'), str(out_dir / 'p2_genus.html')]
+    assert sorted(path.name for path in out_dir.iterdir()) == ['p1_genus.html', 'p2_genus.html', 'plotly.min.js']
+
+    # p2 has one more metadata variable than p1, which is not plotted as a feature
+    assert '"Depth"' not in (out_dir / 'p2_genus.html').read_text()
+
+
+def test_batch_rejects_mismatched_metadata_count(tmp_path):
+    profiles = [str(tmp_path / 'p{}.tsv'.format(i)) for i in range(3)]
+
+    with pytest.raises(Exception, match='either one metadata file or one per profile table'):
+        render_profiles_batch(profiles, ['m1.tsv', 'm2.tsv'], str(tmp_path / 'plots'))
@@ -0,0 +1,40 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+from bioinfo_utils import TOOLS
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['pandas', 'plotly', 'skbio']
+
+# stacked_barplot already uses --profile for its input table
+PROFILE_FLAGS = {'stacked_barplot': '--profile_report'}
+
+
+def run_python(*args):
+    """Run Python from the repository root in a fresh process"""
+    return subprocess.run([sys.executable] + list(args), cwd=REPO_DIR, capture_output=True, text=True, check=True)
+
+
+@pytest.mark.parametrize('tool', list(TOOLS))
+def test_tool_help(tool):
+    result = run_python('bioinfo_utils.py', tool, '--help')
+
+    # Every tool lists the shared profiling option (taking a report PATH) among its options
+    profile_flag = PROFILE_FLAGS.get(tool, '--profile')
+    assert re.search(r'^\s+{} PATH\s'.format(profile_flag), result.stdout, flags=re.MULTILINE)
+
+
+@pytest.mark.parametrize('module', ['gff_parser', 'filter_fasta_by_id'])
+def test_import_skips_heavy_modules(module):
+    # The heavy dependencies are only imported by the subcommands using them
+    result = run_python(
+        '-c', 'import sys, {}; print(",".join(sorted(set(sys.modules) & set({!r}))))'.format(module, HEAVY_MODULES)
+    )
+
+    assert result.stdout.strip() == ''
@@ -0,0 +1,23 @@
+import pandas as pd
+
+from bioinfo_utils_table_io import read_table, write_tsv
+
+
+def test_write_tsv_quotes_special_characters(tmp_path):
+    df = pd.DataFrame({'Gene_name': ['a"b', 'c\td', 'e\nf', 'g'], 'TPM': [1.5, 2.0, 0.25, 3.0]})
+    tsv = str(tmp_path / 'table.tsv')
+
+    write_tsv(df, tsv)
+
+    pd.testing.assert_frame_equal(read_table(tsv), df)
+
+
+def test_write_tsv_keeps_pandas_booleans(tmp_path):
+    df = pd.DataFrame({'Gene_name': ['a', 'b'], 'Is_expressed': [True, False]})
+    tsv = str(tmp_path / 'table.tsv')
+
+    write_tsv(df, tsv)
+    write_tsv(df, tsv, append=True)
+
+    with open(tsv) as table:
+        assert table.read().splitlines() == ['Gene_name\tIs_expressed', 'a\tTrue', 'b\tFalse', 'a\tTrue', 'b\tFalse']